@@ -18,12 +18,25 @@
 #######################################################################
 
 __all__ = [
+    'archive',
     'camera',
+    'catalog',
     'configuration',
+    'dataset',
+    'dedup',
     'detection',
+    'display',
+    'events',
     'imgproc',
     'misc',
     'opt',
     'pathname',
-    'recognition'
+    'pipeline',
+    'profiler',
+    'quality',
+    'recognition',
+    'recorder',
+    'runtime',
+    'shards',
+    'sightings'
 ]
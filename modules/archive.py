@@ -0,0 +1,84 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import collections
+import io
+import os
+import tarfile
+import zipfile
+
+EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.ppm', '.tif', '.tiff')
+
+
+def is_archive(path):
+    """
+    Returns whether the path is a zip or tar archive (possibly compressed)
+    """
+    if not os.path.isfile(path):
+        return False
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def is_image(name):
+    return name.lower().endswith(EXTENSIONS) and not os.path.basename(name).startswith('.')
+
+
+def count(path):
+    """
+    Returns the number of images in an archive, or None when
+    that would require a full pass (tar archives)
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return len([i for i in archive.infolist() if not i.is_dir() and is_image(i.filename)])
+    return None
+
+
+def members(path):
+    """
+    Yields (name, file object) for every image in an archive, in archive order.
+    Members are read one at a time into memory; nothing is extracted to disk.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image(info.filename):
+                    yield (info.filename, io.BytesIO(archive.read(info)))
+    else:
+        # Stream mode, so compressed tars are never seeked or fully decompressed
+        with tarfile.open(path, mode='r|*') as archive:
+            for info in archive:
+                if info.isfile() and is_image(info.name):
+                    yield (info.name, io.BytesIO(archive.extractfile(info).read()))
+
+
+def ordered_map(executor, function, iterable, prefetch=8):
+    """
+    Like executor.map, but only keeps a bounded number of items in flight,
+    so a large archive is never read into memory all at once
+    """
+    pending = collections.deque()
+
+    for item in iterable:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= prefetch:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
@@ -17,6 +17,9 @@
 # If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
 #######################################################################
 
+import os
+import time
+
 import cv2
 
 
@@ -31,8 +34,13 @@ class Camera():
         self.__camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.__height)
 
     def __del__(self):
-        self.__camera.release()
-        del self.__camera
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
     def __str__(self):
         return 'Camera {:d}'.format(self.__source)
@@ -56,3 +64,77 @@ class Camera():
 
     def release(self):
         return self.__camera.release()
+
+
+class VirtualCamera():
+    """
+    Stands in for a Camera by replaying a directory of images or a video file,
+    looping forever, at a fixed frame rate.
+    """
+    def __init__(self, source, config, fps=0):
+        camera = config['Camera']
+        self.__source = source
+        self.__width = int(camera['width'])
+        self.__height = int(camera['height'])
+        self.__interval = 1.0 / fps if fps > 0 else 0.0
+        self.__deadline = 0.0
+        self.__images = []
+        self.__video = None
+        self.__index = 0
+
+    def __str__(self):
+        return 'Virtual Camera {}'.format(os.path.basename(os.path.normpath(self.__source)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def width(self):
+        return self.__width
+
+    def open(self):
+        if os.path.isdir(self.__source):
+            self.__images = sorted(os.path.join(self.__source, f) for f in os.listdir(self.__source))
+            return len(self.__images) > 0
+        else:
+            self.__video = cv2.VideoCapture(self.__source)
+            return self.__video.isOpened()
+
+    def read(self):
+        # Hold the frame rate, like a real camera would
+        now = time.monotonic()
+        if now < self.__deadline:
+            time.sleep(self.__deadline - now)
+        self.__deadline = max(now, self.__deadline) + self.__interval
+
+        if self.__video is not None:
+            retval, frame = self.__video.read()
+            if not retval:
+                self.__video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                retval, frame = self.__video.read()
+        else:
+            frame = None
+            for i in range(len(self.__images)):
+                frame = cv2.imread(self.__images[self.__index])
+                self.__index = (self.__index + 1) % len(self.__images)
+                if frame is not None:
+                    break
+            retval = frame is not None
+
+        if retval and (frame.shape[1], frame.shape[0]) != (self.__width, self.__height):
+            frame = cv2.resize(frame, (self.__width, self.__height))
+
+        return (retval, frame)
+
+    def release(self):
+        if self.__video is not None:
+            self.__video.release()
+            self.__video = None
+        self.__images = []
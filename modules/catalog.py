@@ -0,0 +1,192 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import json
+import os
+import tempfile
+import time
+
+from . import pathname
+
+VERSION = 1
+RAW = 'raw'
+TRAINING = 'training'
+
+# A listing taken this soon after the directory's mtime may have missed a write
+# in the same mtime tick, so it is listed again instead of being trusted
+RACY_NS = 2 * 10**9
+
+__CATALOG__ = None
+
+
+def get():
+    """
+    Returns the process-wide catalog.
+    """
+    global __CATALOG__
+
+    if __CATALOG__ is None:
+        __CATALOG__ = Catalog(pathname.get_catalog_file())
+
+    return __CATALOG__
+
+
+class Catalog:
+    """
+    Index of the labels, their raw and training images, and the recognizer models.
+    It is saved to a single file and validated lazily: each lookup only stats the
+    directory it needs, and lists it again only when that directory's mtime changed.
+    Changes are saved once per public call.
+    """
+    def __init__(self, file_):
+        self.__file = file_
+        self.__dirs = {}
+        self.__dirty = False
+
+        try:
+            with open(file_) as f:
+                index = json.load(f)
+            if index.get('version') == VERSION:
+                self.__dirs = index['dirs']
+        except (OSError, ValueError) as error:
+            self.__dirs = {}
+
+    def refresh(self):
+        """
+        Revalidates every indexed directory. Returns True if any changed.
+        """
+        changed = False
+
+        for path in list(self.__dirs):
+            changed = self.__validate(path, self.__dirs[path].get('directories', False)) or changed
+
+        self.__flush()
+        return changed
+
+    def save(self):
+        self.__dirty = False
+        directory = os.path.dirname(self.__file)
+        try:
+            fd, temporary = tempfile.mkstemp(prefix='.catalog.', suffix='.tmp', dir=directory)
+        except OSError as ose:
+            # A read-only data directory only costs the next run a rescan
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': VERSION, 'dirs': self.__dirs}, f)
+            os.replace(temporary, self.__file)
+        except OSError as ose:
+            try:
+                os.remove(temporary)
+            except OSError as error:
+                pass
+
+    def labels(self):
+        return self.__flush(self.__labels())
+
+    def raw_labels(self):
+        return self.__flush([l for l in self.__labels() if self.__exists(pathname.get_raw_root(l))])
+
+    def training_labels(self):
+        return self.__flush([l for l in self.__labels() if self.__exists(pathname.get_training_root(l))])
+
+    def recognizer_labels(self):
+        entries = self.__entries(pathname.get_recognizer_root())
+        return self.__flush([f.split('.')[0] for f in entries if f.endswith('.xml') and not f.startswith('.')])
+
+    def has_raw(self, label):
+        return self.__flush(self.__exists(pathname.get_raw_root(label)))
+
+    def has_training(self, label):
+        return self.__flush(self.__exists(pathname.get_training_root(label)))
+
+    def has_recognizer(self, label):
+        name = os.path.basename(pathname.get_recognizer_file(label))
+        return self.__flush(name in self.__entries(pathname.get_recognizer_root()))
+
+    def raw_images(self, label):
+        return self.__flush(self.__paths(pathname.get_raw_root(label)))
+
+    def training_images(self, label):
+        return self.__flush(self.__paths(pathname.get_training_root(label)))
+
+    def count(self, label, kind=TRAINING):
+        root = pathname.get_raw_root(label) if kind == RAW else pathname.get_training_root(label)
+        return self.__flush(len(self.__entries(root)))
+
+    def mtime(self, path):
+        """
+        The mtime (in nanoseconds) of an indexed directory, or None.
+        """
+        entry = self.__dirs.get(path)
+        return entry['mtime'] if entry else None
+
+    def __flush(self, result=None):
+        """
+        Saves the catalog if the lookups since the last save changed it.
+        Returns result, so public lookups can save on their way out.
+        """
+        if self.__dirty:
+            self.save()
+        return result
+
+    def __labels(self):
+        return list(self.__entries(pathname.get_faces_root(), directories=True))
+
+    def __exists(self, path):
+        self.__validate(path)
+        return path in self.__dirs
+
+    def __entries(self, path, directories=False):
+        self.__validate(path, directories)
+        entry = self.__dirs.get(path)
+        return entry['entries'] if entry else []
+
+    def __paths(self, path):
+        return [os.path.join(path, name) for name in self.__entries(path)]
+
+    def __validate(self, path, directories=False):
+        """
+        Brings the entry of one directory up to date. Returns True if it changed.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as ose:
+            if self.__dirs.pop(path, None) is None:
+                return False
+            self.__dirty = True
+            return True
+
+        previous = self.__dirs.get(path)
+        if previous and previous['mtime'] == mtime and previous.get('listed', 0) - mtime >= RACY_NS:
+            return False
+
+        listed = time.time_ns()
+        with os.scandir(path) as it:
+            if directories:
+                entries = sorted(e.name for e in it if e.is_dir())
+            else:
+                entries = sorted(e.name for e in it if e.is_file())
+
+        self.__dirs[path] = {'mtime': mtime, 'listed': listed, 'entries': entries}
+        if directories:
+            self.__dirs[path]['directories'] = True
+        self.__dirty = True
+        return not previous or previous['mtime'] != mtime or previous['entries'] != entries
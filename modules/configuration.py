@@ -34,6 +34,9 @@ class Config:
 
         self.__config = dict(self.__config)
 
+    def sections(self):
+        return list(self.__config)
+
     def __getitem__(self, key):
         if key in self.__config:
             return self.__config[key]
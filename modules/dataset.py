@@ -0,0 +1,93 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import concurrent.futures
+import threading
+
+import cv2
+
+from . import dedup
+from . import imgproc
+from . import pathname
+
+
+class DatasetWriter:
+    """
+    Preprocesses, deduplicates, and saves training faces on a pool of threads,
+    so encoding PNGs never holds up the caller.
+    """
+    def __init__(self, label, width, height, threads=2, index=None, start=0):
+        self.__label = label
+        self.__width = width
+        self.__height = height
+        self.__index = index
+        self.__next = start
+        self.__lock = threading.Lock()
+        self.__queued = 0
+        self.__written = 0
+        self.__duplicates = 0
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+    @property
+    def duplicates(self):
+        return self.__duplicates
+
+    @property
+    def queued(self):
+        return self.__queued
+
+    @property
+    def written(self):
+        return self.__written
+
+    def submit(self, frame, box):
+        """
+        Queues a face to be saved. The frame must not be modified afterwards.
+        """
+        with self.__lock:
+            self.__queued = self.__queued + 1
+        self.__executor.submit(self.__save, frame, box)
+
+    def close(self):
+        """
+        Waits for the queued faces to be saved.
+        """
+        self.__executor.shutdown(wait=True)
+
+    def __save(self, frame, box):
+        (x, y, w, h) = box
+
+        try:
+            image = imgproc.preprocess(frame, self.__width, self.__height, x, y, w, h)
+            hash_ = dedup.dhash(image) if self.__index is not None else None
+
+            with self.__lock:
+                if self.__index is not None and self.__index.add_unique(hash_) is not None:
+                    self.__duplicates = self.__duplicates + 1
+                    return
+                number = self.__next
+                self.__next = self.__next + 1
+
+            cv2.imwrite(pathname.get_training_file(self.__label, number), image)
+
+            with self.__lock:
+                self.__written = self.__written + 1
+        finally:
+            with self.__lock:
+                self.__queued = self.__queued - 1
@@ -0,0 +1,124 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import cv2
+import numpy
+
+HASH_SIZE = 8
+
+# LBPH keeps one 8x8 grid of 256 bin histograms (float32) per training image,
+# with the default grid and neighbors, in memory (the saved XML is larger)
+LBPH_HISTOGRAM_BYTES = 8 * 8 * 256 * 4
+
+
+def dhash(face, size=HASH_SIZE):
+    """
+    Computes the difference hash of a (preprocessed, grayscale) face.
+    Each bit records whether a pixel is brighter than its right neighbour.
+    """
+    small = cv2.resize(face, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = numpy.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def hamming(a, b):
+    """
+    Counts the bits that differ between two hashes.
+    """
+    return bin(a ^ b).count('1')
+
+
+class HashIndex:
+    """
+    BK-tree of perceptual hashes, answers Hamming distance range queries
+    without comparing against every hash in the index.
+    """
+    def __init__(self, distance):
+        self.__distance = distance
+        self.__root = None
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    @property
+    def distance(self):
+        return self.__distance
+
+    def add(self, hash_, item=None):
+        node = [hash_, hash_ if item is None else item, {}]
+        self.__size = self.__size + 1
+
+        if self.__root is None:
+            self.__root = node
+            return
+
+        current = self.__root
+        while True:
+            d = hamming(hash_, current[0])
+            if d in current[2]:
+                current = current[2][d]
+            else:
+                current[2][d] = node
+                return
+
+    def find(self, hash_):
+        """
+        Returns the item of an indexed hash within the distance, or None.
+        """
+        if self.__root is None:
+            return None
+
+        candidates = [self.__root]
+        while len(candidates) > 0:
+            node = candidates.pop()
+            d = hamming(hash_, node[0])
+            if d <= self.__distance:
+                return node[1]
+            for child_d, child in node[2].items():
+                if d - self.__distance <= child_d <= d + self.__distance:
+                    candidates.append(child)
+
+        return None
+
+    def add_unique(self, hash_, item=None):
+        """
+        Indexes a hash unless it is a near-duplicate.
+        Returns the item it duplicates, or None if it was added.
+        """
+        duplicate = self.find(hash_)
+        if duplicate is None:
+            self.add(hash_, item)
+        return duplicate
+
+
+def print_savings(kept, dropped):
+    """
+    Summarizes what removing near-duplicates saves in the trained model.
+    LBPH model size and predict() time both grow linearly with the image count,
+    the savings are estimated from that rather than measured.
+    """
+    total = kept + dropped
+    percent = (dropped / total) * 100 if total > 0 else 0.0
+    print('Duplicate Summary:')
+    print('  Kept:\t    {}'.format(kept))
+    print('  Dropped:   {}'.format(dropped))
+    print('  Model:\t    ~{:.1f} MiB smaller in memory ({:.1f}%, estimated)'.format(
+        dropped * LBPH_HISTOGRAM_BYTES / 2**20, percent))
+    print('  Predict:   ~{:.1f}% less work (estimated)'.format(percent))
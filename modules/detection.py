@@ -18,29 +18,159 @@
 #######################################################################
 
 import re
+import threading
+import time
 
 import cv2
 
+from . import imgproc
 from . import pathname
+from . import runtime
+
+MERGE_OVERLAP = 0.3
+MERGE_CONTAINMENT = 0.7
 
 
 class Detector:
     def __init__(self, classifier, config):
         detector = config['Detector']
 
-        if classifier:
-            self.__classifier = cv2.CascadeClassifier(classifier)
-        else:
-            self.__classifier = cv2.CascadeClassifier(pathname.get_classifier_root() + detector['classifier'])
+        if not classifier:
+            classifier = pathname.get_classifier_root() + detector['classifier']
 
+        self.__file = classifier
+        self.__classifier = cv2.CascadeClassifier(classifier)
+        self.__local = threading.local()
         self.__flags = int(detector['flags'])
         self.__scaleFactor = float(detector['scaleFactor'])
         self.__minNeighbors = int(detector['minNeighbors'])
         self.__minSize = tuple(map(int, re.split('\s*,\s*', detector['minSize'])))
         self.__maxSize = tuple(map(int, re.split('\s*,\s*', detector['maxSize'])))
 
+        # Optional regions of interest and tiling, in frame coordinates
+        self.__regions = parse_regions(detector.get('regions', ''))
+        self.__tiles = tuple(map(int, re.split('\s*,\s*', detector.get('tiles', '1, 1'))))
+        self.__overlap = int(detector.get('overlap', str(max(self.__maxSize))))
+        self.__executor = None
+
+        # Optional second cascade that verifies the candidates of the first
+        self.__verifier = None
+        self.__timing = {'proposal': 0.0, 'verification': 0.0, 'candidates': 0, 'verified': 0}
+
+        if detector.get('verifier'):
+            self.__verifier = cv2.CascadeClassifier(pathname.get_classifier_root() + detector['verifier'])
+            self.__vpadding = float(detector.get('verifier_padding', '0.2'))
+            self.__vscaleFactor = float(detector.get('verifier_scaleFactor', str(self.__scaleFactor)))
+            self.__vminNeighbors = int(detector.get('verifier_minNeighbors', '3'))
+
+        manager = runtime.Runtime(config)
+        threads = int(detector.get('threads', str(manager.workers)))
+        if threads > 1 and self.__tiles[0] * self.__tiles[1] * max(1, len(self.__regions)) > 1:
+            self.__executor = manager.thread_pool(threads)
+
+    def close(self):
+        """
+        Shuts down the tile/region thread pool, if any.
+        """
+        if self.__executor:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
+    @property
+    def timing(self):
+        """
+        Seconds spent in each stage, and the number of candidates
+        and verified faces, for the last frame.
+        """
+        return self.__timing
+
     def detect(self, frame):
-        objects = self.__classifier.detectMultiScale(
+        start = time.perf_counter()
+        objects = self.__propose(frame)
+        self.__timing['proposal'] = time.perf_counter() - start
+        self.__timing['candidates'] = len(objects)
+
+        if self.__verifier:
+            start = time.perf_counter()
+            objects = self.__verify(frame, objects)
+            self.__timing['verification'] = time.perf_counter() - start
+
+        self.__timing['verified'] = len(objects)
+        return objects
+
+    def __propose(self, frame):
+        if len(self.__regions) == 0 and self.__tiles == (1, 1):
+            return self.__detect(self.__classifier, frame)
+
+        areas = self.areas(frame.shape[1], frame.shape[0])
+
+        if self.__executor:
+            results = self.__executor.map(lambda a: self.__detect_area(frame, a), areas)
+        else:
+            results = map(lambda a: self.__detect_area(frame, a), areas)
+
+        objects = [box for boxes in results for box in boxes]
+
+        if self.__tiles != (1, 1):
+            objects = merge_boxes(objects)
+
+        return objects
+
+    def areas(self, width, height):
+        """
+        Splits the regions of interest (or the whole frame) into overlapping tiles.
+        """
+        areas = []
+        regions = self.__regions if len(self.__regions) > 0 else [(0, 0, width, height)]
+        columns, rows = self.__tiles
+
+        for (x, y, w, h) in regions:
+            # Keep the region inside the frame
+            x, y = max(0, x), max(0, y)
+            w, h = min(w, width - x), min(h, height - y)
+            if w <= 0 or h <= 0:
+                continue
+
+            tw, th = -(-w // columns), -(-h // rows)
+            for r in range(rows):
+                for c in range(columns):
+                    tx, ty = max(x, x + c*tw - self.__overlap // 2), max(y, y + r*th - self.__overlap // 2)
+                    bx, by = min(x + w, x + (c+1)*tw + self.__overlap // 2), min(y + h, y + (r+1)*th + self.__overlap // 2)
+                    if (tx, ty, bx - tx, by - ty) not in areas:
+                        areas.append((tx, ty, bx - tx, by - ty))
+
+        return areas
+
+    def __verify(self, frame, candidates):
+        """
+        Keeps the candidates the verifier also finds a face in, using its tighter box.
+        Only the padded candidate is scanned, never the whole frame.
+        """
+        verified = []
+        height, width = frame.shape[:2]
+
+        for (x, y, w, h) in candidates:
+            pad = int(max(w, h) * self.__vpadding)
+            x1, y1 = max(0, x - pad), max(0, y - pad)
+            x2, y2 = min(width, x + w + pad), min(height, y + h + pad)
+
+            objects = self.__verifier.detectMultiScale(
+                frame[y1: y2, x1: x2],
+                flags=self.__flags,
+                scaleFactor=self.__vscaleFactor,
+                minNeighbors=self.__vminNeighbors,
+                minSize=(w // 2, h // 2),
+                maxSize=(x2 - x1, y2 - y1)
+            )
+
+            if len(objects) > 0:
+                (ox, oy, ow, oh) = max(objects, key=lambda o: o[2] * o[3])
+                verified.append((ox + x1, oy + y1, ow, oh))
+
+        return verified
+
+    def __detect(self, classifier, frame):
+        return classifier.detectMultiScale(
             frame,
             flags=self.__flags,
             scaleFactor=self.__scaleFactor,
@@ -49,4 +179,50 @@ class Detector:
             maxSize=self.__maxSize
         )
 
-        return objects
+    def __detect_area(self, frame, area):
+        (x, y, w, h) = area
+
+        # Cascades keep scratch buffers, so each thread gets its own
+        if self.__executor:
+            if not hasattr(self.__local, 'classifier'):
+                self.__local.classifier = cv2.CascadeClassifier(self.__file)
+            classifier = self.__local.classifier
+        else:
+            classifier = self.__classifier
+
+        # Slicing is a view of the frame, nothing is copied
+        objects = self.__detect(classifier, frame[y: y+h, x: x+w])
+        return [(ox + x, oy + y, ow, oh) for (ox, oy, ow, oh) in objects]
+
+
+def parse_regions(value):
+    """
+    Parses 'x, y, w, h; x, y, w, h; ...' into a list of rectangles.
+    """
+    regions = []
+    for region in value.split(';'):
+        if region.strip():
+            regions.append(tuple(map(int, re.split('\s*,\s*', region.strip()))))
+    return regions
+
+
+def merge_boxes(objects):
+    """
+    Removes the duplicate and partial detections of a face found in overlapping tiles.
+    The largest box of each group is kept.
+    """
+    merged = []
+
+    for box in sorted(objects, key=lambda b: b[2] * b[3], reverse=True):
+        duplicate = False
+        for kept in merged:
+            x1, y1 = max(box[0], kept[0]), max(box[1], kept[1])
+            x2, y2 = min(box[0]+box[2], kept[0]+kept[2]), min(box[1]+box[3], kept[1]+kept[3])
+            contained = (max(0, x2 - x1) * max(0, y2 - y1)) / (box[2] * box[3])
+            if contained >= MERGE_CONTAINMENT or imgproc.intersection_over_union(box, kept) >= MERGE_OVERLAP:
+                duplicate = True
+                break
+        if not duplicate:
+            merged.append(box)
+
+    return merged
@@ -0,0 +1,185 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import threading
+import time
+
+
+def get_fps(config):
+    """
+    The rate windows are redrawn at, from the optional [Display] section.
+    """
+    try:
+        return float(config['Display'].get('fps', '30'))
+    except KeyError as ke:
+        return 30.0
+
+
+class FrameGrabber:
+    """
+    Reads a camera on a background thread, keeping only the newest frame,
+    so neither displaying nor processing ever waits on a stale one.
+    Stops, keeping the error, when the camera stops delivering frames.
+    """
+    def __init__(self, stream):
+        self.__stream = stream
+        self.__condition = threading.Condition()
+        self.__frame = None
+        self.__sequence = 0
+        self.__running = False
+        self.__thread = None
+        self.__error = None
+
+    @property
+    def error(self):
+        """
+        The error that stopped the grabber, or None.
+        """
+        return self.__error
+
+    def latest(self):
+        """
+        Returns the (sequence number, frame) of the newest frame.
+        """
+        with self.__condition:
+            return (self.__sequence, self.__frame)
+
+    def wait(self, sequence, timeout=None):
+        """
+        Waits for a frame newer than the given sequence number.
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__sequence > sequence or not self.__running, timeout)
+            return (self.__sequence, self.__frame)
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='Frame Grabber', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        self.__thread.join()
+
+    def __run(self):
+        from . import pipeline
+        failures = 0
+
+        while self.__running:
+            retval, frame = self.__stream.read()
+            if not retval:
+                failures = failures + 1
+                try:
+                    pipeline.retry_read(self.__stream, failures)
+                except OSError as error:
+                    with self.__condition:
+                        self.__error = error
+                        self.__running = False
+                        self.__condition.notify_all()
+                continue
+
+            failures = 0
+            with self.__condition:
+                self.__frame = frame
+                self.__sequence = self.__sequence + 1
+                self.__condition.notify_all()
+
+
+class Processor:
+    """
+    Applies a function to the newest frames on a background thread,
+    skipping the frames that arrive while it is busy.
+    The latest result is kept together with the frame it came from.
+    An exception raised by the function stops it, and is kept.
+    """
+    def __init__(self, grabber, function):
+        self.__grabber = grabber
+        self.__function = function
+        self.__enabled = True
+        self.__result = None
+        self.__running = False
+        self.__thread = None
+        self.__processed = 0
+        self.__error = None
+
+    @property
+    def enabled(self):
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self.__enabled = value
+        if not value:
+            self.__result = None
+
+    @property
+    def error(self):
+        """
+        The exception that stopped the processor, or None.
+        """
+        return self.__error
+
+    @property
+    def processed(self):
+        return self.__processed
+
+    @property
+    def result(self):
+        """
+        The (sequence number, frame, value) of the last processed frame, or None.
+        """
+        return self.__result
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='Processor', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__running = False
+        self.__thread.join()
+
+    def __run(self):
+        sequence = 0
+
+        while self.__running:
+            latest, frame = self.__grabber.wait(sequence, 0.1)
+            if self.__grabber.error:
+                break
+            if frame is None or latest == sequence:
+                continue
+
+            sequence = latest
+            if not self.__enabled:
+                continue
+
+            try:
+                value = self.__function(frame)
+            except Exception as error:
+                self.__error = error
+                self.__running = False
+                break
+
+            if self.__enabled:
+                self.__result = (latest, frame, value)
+            self.__processed = self.__processed + 1
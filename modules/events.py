@@ -0,0 +1,269 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import asyncio
+import collections
+import json
+import threading
+import time
+
+from . import imgproc
+from . import recognition
+
+APPEARED = 'appeared'
+IDENTIFIED = 'identified'
+LOST = 'lost'
+TRACK_OVERLAP = 0.3
+WRITE_BUFFER_LIMIT = 2**20
+
+
+class Tracker:
+    """
+    Follows faces across frames by box overlap and turns per-frame results
+    into appeared, identified, and lost events.
+    """
+    def __init__(self, config):
+        self.__lost = float(events_settings(config).get('lost', '1.0'))
+        self.__tracks = {}
+        self.__next = 1
+        self.__ids = []
+
+    @property
+    def ids(self):
+        """
+        The track of each face in the last update, in the same order.
+        """
+        return self.__ids
+
+    def update(self, objects, labels, confidences, now=None):
+        now = now or time.time()
+        events = []
+        unmatched = dict(self.__tracks)
+        self.__ids = []
+
+        for box, label, confidence in zip(map(tuple, objects), labels, confidences):
+            box = tuple(int(v) for v in box)
+            match = None
+
+            for id_, track in unmatched.items():
+                if imgproc.intersection_over_union(box, track['box']) >= TRACK_OVERLAP:
+                    match = id_
+                    break
+
+            if match is None:
+                match = self.__next
+                self.__next = self.__next + 1
+                self.__tracks[match] = {'box': box, 'label': None, 'seen': now}
+                events.append(make_event(APPEARED, now, match, box, label, confidence))
+            else:
+                del unmatched[match]
+
+            track = self.__tracks[match]
+            track['box'], track['seen'] = box, now
+            self.__ids.append(match)
+
+            if recognition.is_identified(label) and label != track['label']:
+                track['label'] = label
+                events.append(make_event(IDENTIFIED, now, match, box, label, confidence))
+
+        for id_, track in unmatched.items():
+            if now - track['seen'] >= self.__lost:
+                del self.__tracks[id_]
+                events.append(make_event(LOST, now, id_, track['box'], track['label'], -1))
+
+        return events
+
+
+class Publisher:
+    """
+    Batches events to a sink on an asyncio loop in a background thread.
+    The sink is 'file:PATH' (JSON lines), 'unix:PATH', or 'tcp:HOST:PORT',
+    the last two listen for consumers and send every batch to each of them.
+    publish() never blocks, when the queue is full an event replaces a
+    pending one of the same track and type, otherwise it is dropped.
+    Only events written to the file or to a consumer count as published.
+    """
+    def __init__(self, sink, config):
+        events = events_settings(config)
+        self.__sink = sink
+        self.__batch = int(events.get('batch', '64'))
+        self.__interval = float(events.get('interval', '0.5'))
+        self.__size = int(events.get('queue', '1024'))
+        self.__pending = collections.deque()
+        self.__clients = set()
+        self.__dropped = 0
+        self.__coalesced = 0
+        self.__published = 0
+        self.__closing = False
+        self.__ready = threading.Event()
+        self.__error = None
+
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__run, name='Event Publisher', daemon=True)
+        self.__thread.start()
+        self.__ready.wait()
+
+        if self.__error:
+            raise self.__error
+
+    @property
+    def coalesced(self):
+        return self.__coalesced
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def published(self):
+        return self.__published
+
+    def publish(self, event):
+        self.__loop.call_soon_threadsafe(self.__enqueue, event)
+
+    def close(self):
+        """
+        Sends what is still queued and stops the publisher.
+        """
+        self.__loop.call_soon_threadsafe(self.__stop)
+        self.__thread.join()
+
+    def __enqueue(self, event):
+        if len(self.__pending) < self.__size:
+            self.__pending.append(event)
+        else:
+            key = (event['track'], event['type'])
+            for i, queued in enumerate(self.__pending):
+                if (queued['track'], queued['type']) == key:
+                    self.__pending[i] = event
+                    self.__coalesced = self.__coalesced + 1
+                    return
+            self.__dropped = self.__dropped + 1
+
+        if len(self.__pending) >= self.__batch:
+            self.__wakeup.set()
+
+    def __stop(self):
+        self.__closing = True
+        self.__wakeup.set()
+
+    def __run(self):
+        asyncio.set_event_loop(self.__loop)
+        self.__wakeup = asyncio.Event()
+
+        try:
+            self.__loop.run_until_complete(self.__open())
+        except OSError as error:
+            self.__error = error
+            self.__ready.set()
+            return
+
+        self.__ready.set()
+        self.__loop.run_until_complete(self.__flush())
+        self.__loop.run_until_complete(self.__shutdown())
+        self.__loop.close()
+
+    async def __open(self):
+        kind, _, target = self.__sink.partition(':')
+        self.__server, self.__file = None, None
+
+        if kind == 'file':
+            self.__file = open(target, 'a')
+        elif kind == 'unix':
+            self.__server = await asyncio.start_unix_server(self.__accept, path=target)
+        elif kind == 'tcp':
+            host, _, port = target.rpartition(':')
+            self.__server = await asyncio.start_server(self.__accept, host or '127.0.0.1', int(port))
+        else:
+            raise OSError('Unknown event sink: {}'.format(self.__sink))
+
+    async def __accept(self, reader, writer):
+        self.__clients.add(writer)
+        try:
+            # Consumers only listen, wait for them to hang up
+            await reader.read()
+        finally:
+            self.__clients.discard(writer)
+            writer.close()
+
+    async def __flush(self):
+        while not (self.__closing and len(self.__pending) == 0):
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), self.__interval)
+            except asyncio.TimeoutError:
+                pass
+            self.__wakeup.clear()
+
+            while len(self.__pending) > 0:
+                batch = [self.__pending.popleft() for i in range(min(self.__batch, len(self.__pending)))]
+                data = ''.join(json.dumps(e) + '\n' for e in batch)
+                await self.__send(data, len(batch))
+
+    async def __send(self, data, count):
+        if self.__file:
+            await self.__loop.run_in_executor(None, self.__write_file, data)
+            self.__published = self.__published + count
+            return
+
+        delivered = 0
+        for writer in list(self.__clients):
+            # Skip consumers that are not keeping up rather than buffer forever
+            if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                self.__dropped = self.__dropped + count
+                continue
+            writer.write(data.encode())
+            delivered = delivered + 1
+
+        if delivered > 0:
+            self.__published = self.__published + count
+
+    def __write_file(self, data):
+        self.__file.write(data)
+        self.__file.flush()
+
+    async def __shutdown(self):
+        if self.__file:
+            self.__file.close()
+        if self.__server:
+            self.__server.close()
+            for writer in list(self.__clients):
+                writer.close()
+
+        # Closing their connections lets the consumers in __accept() finish
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        if len(tasks) > 0:
+            await asyncio.wait(tasks, timeout=1.0)
+
+
+def events_settings(config):
+    try:
+        return config['Events']
+    except KeyError as ke:
+        return {}
+
+
+def make_event(type_, now, track, box, label, confidence):
+    return {
+        'type': type_,
+        'time': now,
+        'track': track,
+        'box': list(box),
+        'label': label,
+        'confidence': int(confidence)
+    }
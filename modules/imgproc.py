@@ -18,16 +18,53 @@
 #######################################################################
 
 import cv2
+import numpy
 
 
-def draw_face_info(image, objects, labels, confidences):
+class TextCache:
+    """
+    Keeps rasterized text, so overlays repeated every frame are only rendered once
+    """
+    def __init__(self, size=256):
+        self.__size = size
+        self.__cache = {}
+
+    def draw(self, image, text, org, color, font=cv2.FONT_HERSHEY_PLAIN, scale=1):
+        key = (text, font, scale)
+        entry = self.__cache.get(key)
+
+        if entry is None:
+            (w, h), baseline = cv2.getTextSize(text, font, scale, 1)
+            mask = numpy.zeros((h + baseline, w), numpy.uint8)
+            cv2.putText(mask, text, (0, h), font, scale, 255)
+            entry = (mask > 0, h)
+            if len(self.__cache) >= self.__size:
+                self.__cache.clear()
+            self.__cache[key] = entry
+
+        # Like cv2.putText, org is the bottom-left corner of the text
+        mask, h = entry
+        x, y = org[0], org[1] - h
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(image.shape[1], x + mask.shape[1]), min(image.shape[0], y + mask.shape[0])
+        if x2 > x1 and y2 > y1:
+            image[y1: y2, x1: x2][mask[y1-y: y2-y, x1-x: x2-x]] = color
+
+
+def draw_face_info(image, objects, labels, confidences, cache=None):
     """
     Draws the rectangle, label, and confidence around a face
     """
     for i, (x, y, w, h) in enumerate(objects):
+        label = labels[i].title() + ' (' + str(confidences[i]) + ')'
+        size = '{:d}x{:d}'.format(w, h)
         cv2.rectangle(image, (x, y), (x+w, y+h), (0, 255, 255), 2)
-        cv2.putText(image, labels[i].title() + ' (' + str(confidences[i]) + ')', (x, y), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255))
-        cv2.putText(image, '{:d}x{:d}'.format(w, h), (x, y+h+13), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255))
+        if cache:
+            cache.draw(image, label, (x, y), (0, 0, 255))
+            cache.draw(image, size, (x, y+h+13), (0, 0, 255))
+        else:
+            cv2.putText(image, label, (x, y), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255))
+            cv2.putText(image, size, (x, y+h+13), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255))
 
 
 def preprocess(frame, width, height, x, y, w, h):
@@ -40,3 +77,40 @@ def preprocess(frame, width, height, x, y, w, h):
     equalized = cv2.equalizeHist(resized)
     filtered = cv2.bilateralFilter(equalized, 5, 60, 60)
     return filtered
+
+
+def measure_quality(frame, x, y, w, h):
+    """
+    Measures the sharpness (Laplacian variance), brightness (mean),
+    and contrast (standard deviation) of a face
+    """
+    cropped = frame[y: y+h, x: x+w]
+    grayed = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY) if cropped.ndim == 3 else cropped
+    sharpness = cv2.Laplacian(grayed, cv2.CV_64F).var()
+    mean, stddev = cv2.meanStdDev(grayed)
+    return (sharpness, mean[0][0], stddev[0][0])
+
+
+def intersection_over_union(a, b):
+    """
+    Computes the overlap ratio of two (x, y, w, h) boxes
+    """
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0]+a[2], b[0]+b[2]), min(a[1]+a[3], b[1]+b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a[2]*a[3] + b[2]*b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def read_image(source, width):
+    """
+    Reads an image from a path or file object, resized to
+    the given width while keeping its aspect ratio
+    """
+    from PIL import Image
+
+    image_pil = Image.open(source)
+    image_org = numpy.array(image_pil)
+    image_rgb = cv2.cvtColor(image_org, cv2.COLOR_BGR2RGB)
+    ar_height = int(width / (image_pil.size[0] / image_pil.size[1]))
+    return cv2.resize(image_rgb, (width, ar_height))
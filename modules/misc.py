@@ -17,15 +17,32 @@
 # If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
 #######################################################################
 
-try:
-    import tkinter
-
-    def get_display_resolution():
-        tk = tkinter.Tk()
-        width = tk.winfo_screenwidth()
-        height = tk.winfo_screenheight()
-        return (width, height)
-
-except ImportError as ie:
-    def get_display_resolution():
-        return (0, 0)
+__RESOLUTION__ = None
+
+
+def get_display_resolution():
+    """
+    Queries the display resolution once and caches it.
+    Returns (0, 0) if Tkinter or a display is unavailable.
+    """
+    global __RESOLUTION__
+
+    if __RESOLUTION__ is None:
+        __RESOLUTION__ = (0, 0)
+
+        try:
+            import tkinter
+        except ImportError as ie:
+            return __RESOLUTION__
+
+        try:
+            tk = tkinter.Tk()
+        except tkinter.TclError as te:
+            return __RESOLUTION__
+
+        try:
+            __RESOLUTION__ = (tk.winfo_screenwidth(), tk.winfo_screenheight())
+        finally:
+            tk.destroy()
+
+    return __RESOLUTION__
@@ -19,6 +19,8 @@
 
 import os
 
+from . import archive
+from . import catalog
 from . import pathname
 
 
@@ -40,18 +42,17 @@ def default_settings():
         return 'default'
 
 
-def map_settings():
+def find_settings(key):
     """
-    Maps simple settings filenames to their absolute paths.
+    Resolves a simple settings filename to its absolute path,
+    without listing the settings directory.
     """
-    settings = {}
-    ents = os.listdir(pathname.get_settings_root())
+    path = os.path.abspath(pathname.get_settings_root() + key + '.txt')
 
-    for ent in ents:
-        key = ent[0:-4]
-        settings[key] = os.path.abspath(pathname.get_settings_root() + ent)
-
-    return settings
+    if os.path.isfile(path):
+        return path
+    else:
+        return None
 
 
 def validate_file(path):
@@ -64,11 +65,21 @@ def validate_file(path):
         return None
 
 
+def validate_archive(path):
+    """
+    Ensures the given file is a zip or tar archive.
+    """
+    if archive.is_archive(path):
+        return path
+    else:
+        return None
+
+
 def validate_raw_dataset(label):
     """
     Ensures the given label has a raw dataset.
     """
-    if os.path.isdir(pathname.get_raw_root(label)):
+    if catalog.get().has_raw(label):
         return label
     else:
         return None
@@ -78,7 +89,7 @@ def validate_training_dataset(label):
     """
     Ensures the given label has a training dataset.
     """
-    if os.path.isdir(pathname.get_training_root(label)):
+    if catalog.get().has_training(label):
         return label
     else:
         return None
@@ -88,7 +99,7 @@ def validate_recognizer(label):
     """
     Ensures the given label has a recognizer.
     """
-    if os.path.isfile(pathname.get_recognizer_file(label)):
+    if catalog.get().has_recognizer(label):
         return label
     else:
         return None
@@ -22,41 +22,56 @@ import os
 __ROOT_DIR__ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+def get_catalog_file():
+    return os.path.join(__ROOT_DIR__, 'data', 'catalog.json')
+
+
 def get_classifier_root():
-    return __ROOT_DIR__ + '/data/classifiers/'
+    return os.path.join(__ROOT_DIR__, 'data', 'classifiers', '')
+
+
+def get_faces_root():
+    return os.path.join(__ROOT_DIR__, 'data', 'faces', '')
 
 
 def get_raw_root(label):
-    return __ROOT_DIR__ + '/data/faces/' + label + '/raw/'
+    return os.path.join(__ROOT_DIR__, 'data', 'faces', label, 'raw', '')
 
 
 def get_raw_images(label):
-    image_paths = []
-    raw_path = get_raw_root(label)
-    for path in os.listdir(raw_path):
-        image_paths.append(os.path.join(raw_path, path))
-    return image_paths
+    from . import catalog
+    return catalog.get().raw_images(label)
 
 
 def get_recognizer_root():
-    return __ROOT_DIR__ + '/data/recognizers/'
+    return os.path.join(__ROOT_DIR__, 'data', 'recognizers', '')
 
 
 def get_recognizer_file(label):
-    return __ROOT_DIR__ + '/data/recognizers/' + label + '.lbph.xml'
+    return os.path.join(__ROOT_DIR__, 'data', 'recognizers', label + '.lbph.xml')
 
 
 def get_settings_root():
-    return __ROOT_DIR__ + '/settings/'
+    return os.path.join(__ROOT_DIR__, 'settings', '')
+
+
+def get_sightings_file():
+    return os.path.join(__ROOT_DIR__, 'data', 'sightings.db')
 
 
 def get_training_root(label):
-    return __ROOT_DIR__ + '/data/faces/' + label + '/training/'
+    return os.path.join(__ROOT_DIR__, 'data', 'faces', label, 'training', '')
 
 
 def get_training_images(label):
-    image_paths = []
-    training_path = get_training_root(label)
-    for path in os.listdir(training_path):
-        image_paths.append(os.path.join(training_path, path))
-    return image_paths
+    from . import catalog
+    return catalog.get().training_images(label)
+
+
+def get_training_labels():
+    from . import catalog
+    return catalog.get().training_labels()
+
+
+def get_training_file(label, number):
+    return os.path.join(get_training_root(label), '{}.{:02d}.png'.format(label, number))
@@ -0,0 +1,452 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+
+import abc
+import functools
+import os
+import threading
+import time
+
+import cv2
+
+from . import archive
+from . import configuration
+from . import detection
+from . import imgproc
+from . import quality
+from . import recognition
+from . import runtime
+
+INLINE = 'inline'
+THREAD = 'thread'
+PROCESS = 'process'
+
+# Consecutive failed camera reads before giving up, waiting twice as long after each, up to a second
+READ_FAILURES = 20
+READ_BACKOFF = 0.01
+
+# Stages installed in a process pool worker, by key
+__STAGES__ = {}
+
+
+class Frame:
+    """
+    A frame moving through a pipeline, along with what each stage
+    found in it and how long each stage took (in seconds).
+    """
+    def __init__(self, sequence, name, image, error=None):
+        self.sequence = sequence
+        self.name = name
+        self.image = image
+        self.error = error
+        self.objects = []
+        self.labels = []
+        self.confidences = []
+        self.faces = None
+        self.quality = None
+        self.skipped = []
+        self.timing = {}
+        self.meta = {}
+
+
+# Sources
+
+def camera(stream, limit=0):
+    """
+    Yields frames read from an open Camera (or VirtualCamera),
+    forever or until limit frames have been read. Raises an OSError
+    once the stream stops delivering frames.
+    """
+    sequence = 0
+    failures = 0
+
+    while limit <= 0 or sequence < limit:
+        retval, image = stream.read()
+        if not retval:
+            failures = failures + 1
+            retry_read(stream, failures)
+            continue
+        failures = 0
+        yield Frame(sequence, str(stream), image)
+        sequence = sequence + 1
+
+
+def retry_read(stream, failures):
+    """
+    Waits before reading a stream again after a number of consecutive failed reads.
+    Raises an OSError once READ_FAILURES reads in a row have failed.
+    """
+    if failures >= READ_FAILURES:
+        raise OSError('No frames from {} after {} attempts'.format(stream, failures))
+    time.sleep(min(READ_BACKOFF * 2**(failures - 1), 1.0))
+
+
+def video(path, width=0, start=0, stop=0, step=1):
+    """
+    Yields every step'th frame of a video file from frame start up to (not
+    including) frame stop, optionally resized to the given width. Skipped
+    frames are only grabbed, never decoded.
+    """
+    capture = cv2.VideoCapture(path)
+    sequence = start
+
+    if start > 0:
+        # Most codecs seek to a nearby keyframe, walk the rest of the way
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        position = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+        if position < 0 or position > start:
+            capture.release()
+            capture = cv2.VideoCapture(path)
+            position = 0
+        while position < start and capture.grab():
+            position = position + 1
+
+    try:
+        while stop <= 0 or sequence < stop:
+            if (sequence - start) % step != 0:
+                if not capture.grab():
+                    break
+                sequence = sequence + 1
+                continue
+
+            retval, image = capture.read()
+            if not retval:
+                break
+            if width > 0:
+                image = cv2.resize(image, (width, int(width * image.shape[0] / image.shape[1])))
+            frame = Frame(sequence, path, image)
+            frame.meta['position'] = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            yield frame
+            sequence = sequence + 1
+    finally:
+        capture.release()
+
+
+def images(items, width, executor=None, prefetch=8):
+    """
+    Yields the frames of (name, path or file object) items, decoded and resized
+    to the given width, in order. An executor decodes ahead of the consumer.
+    Unreadable images are yielded without an image, with error set.
+    """
+    from PIL import UnidentifiedImageError
+
+    def decode(item):
+        name, source = item
+        try:
+            return (name, imgproc.read_image(source, width), None)
+        except (OSError, ValueError, UnidentifiedImageError, cv2.error) as error:
+            return (name, None, str(error) or type(error).__name__)
+
+    if executor:
+        results = archive.ordered_map(executor, decode, items, prefetch)
+    else:
+        results = map(decode, items)
+
+    for sequence, (name, image, error) in enumerate(results):
+        yield Frame(sequence, name, image, error)
+
+
+def directory(path, width, executor=None, prefetch=8):
+    """
+    Yields the images of a directory, in name order.
+    """
+    names = sorted(e.name for e in os.scandir(path) if e.is_file() and archive.is_image(e.name))
+    paths = (os.path.join(path, n) for n in names)
+    return images(((p, p) for p in paths), width, executor, prefetch)
+
+
+def from_archive(path, width, executor=None, prefetch=8):
+    """
+    Yields the images of a zip or tar archive, streamed member by member.
+    """
+    return images(archive.members(path), width, executor, prefetch)
+
+
+# Stages
+
+class Stage(abc.ABC):
+    """
+    A step of a pipeline, applied to each frame. The heavy object a stage works
+    with (its handle) is built lazily from a factory, once per thread or process
+    running the stage, so the same stage can run inline, on a thread pool or on
+    a process pool. The factory must be picklable to run on a process pool.
+    """
+    name = 'stage'
+
+    def __init__(self, factory=None, mode=INLINE, workers=1):
+        if mode not in (INLINE, THREAD, PROCESS):
+            raise ValueError('Invalid mode \"{}\"'.format(mode))
+
+        self.mode = mode
+        self.workers = workers
+        self.__factory = factory
+        self.__handle = None
+        self.__local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state['_Stage__handle'] is not None:
+            raise TypeError('Stage \"{}\" is bound to an object and cannot run in a process'.format(self.name))
+        del state['_Stage__local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__local = threading.local()
+
+    def __call__(self, frame):
+        if frame.image is None:
+            return frame
+
+        start = time.perf_counter()
+        self.process(frame)
+        frame.timing[self.name] = frame.timing.get(self.name, 0.0) + time.perf_counter() - start
+        return frame
+
+    @classmethod
+    def using(cls, handle, *args, **kwargs):
+        """
+        Creates a stage working with an existing object, shared by every
+        thread running it (so it can not run on a process pool).
+        """
+        stage = cls(*args, **kwargs)
+        stage.__handle = handle
+        return stage
+
+    @property
+    def handle(self):
+        if self.__handle is not None:
+            return self.__handle
+
+        if not hasattr(self.__local, 'handle'):
+            self.__local.handle = self.__factory() if self.__factory else None
+        return self.__local.handle
+
+    @abc.abstractmethod
+    def process(self, frame):
+        """
+        Adds the results of this stage to a frame.
+        """
+
+
+class Detect(Stage):
+    """
+    Finds the faces in a frame.
+    """
+    name = 'detect'
+
+    def __init__(self, classifier=None, config=None, mode=INLINE, workers=1):
+        if mode != INLINE and config is not None:
+            config = serial_config(config, 'Detector')
+        super().__init__(functools.partial(detection.Detector, classifier, config), mode, workers)
+
+    def process(self, frame):
+        frame.objects = list(self.handle.detect(frame.image))
+
+
+class Preprocess(Stage):
+    """
+    Crops and normalizes each face found, skipping (leaving None)
+    the faces the optional quality gate rejects. With measure, the
+    sharpness, brightness and contrast of every face are kept too.
+    """
+    name = 'preprocess'
+
+    def __init__(self, config, mode=INLINE, workers=1, measure=False):
+        super().__init__(functools.partial(quality.QualityGate, config), mode, workers)
+        recognizer = config['Recognizer']
+        self.__width = int(recognizer['width'])
+        self.__height = int(recognizer['height'])
+        self.__measure = measure
+
+    def process(self, frame):
+        frame.faces, frame.skipped = [], []
+        frame.quality = [] if self.__measure else None
+
+        for (x, y, w, h) in frame.objects:
+            measured = None
+            if self.__measure:
+                measured = imgproc.measure_quality(frame.image, x, y, w, h)
+                frame.quality.append(measured)
+
+            reason = self.handle.check(frame.image, x, y, w, h, measured)
+            if reason:
+                frame.faces.append(None)
+                frame.skipped.append(((x, y, w, h), reason))
+            else:
+                frame.faces.append(imgproc.preprocess(frame.image, self.__width, self.__height, x, y, w, h))
+
+
+class Recognize(Stage):
+    """
+    Labels the faces in a frame. After a Preprocess stage only the preprocessed
+    faces are predicted, otherwise the Recognizer detects the faces itself.
+    """
+    name = 'recognize'
+
+    def __init__(self, classifier=None, label=None, config=None, mode=INLINE, workers=1):
+        if mode != INLINE and config is not None:
+            config = serial_config(config, 'Detector', 'Recognizer')
+        super().__init__(functools.partial(recognition.Recognizer, classifier, label, config), mode, workers)
+
+    def process(self, frame):
+        recognizer = self.handle
+
+        if frame.faces is None:
+            frame.objects, frame.labels, frame.confidences = recognizer.recognize(frame.image)
+            frame.skipped = recognizer.skipped
+            return
+
+        frame.labels, frame.confidences = recognizer.predict_faces(frame.faces)
+
+
+# Sinks
+
+class Call(Stage):
+    """
+    Hands each frame to a function, e.g. to publish or store its results.
+    """
+    name = 'call'
+
+    def __init__(self, function, mode=INLINE, workers=1):
+        super().__init__(None, mode, workers)
+        self.__function = function
+
+    def process(self, frame):
+        self.__function(frame)
+
+
+class Draw(Stage):
+    """
+    Overlays the labels and confidences of the faces found on the frame.
+    """
+    name = 'draw'
+
+    def __init__(self, mode=INLINE, workers=1):
+        super().__init__(imgproc.TextCache, mode, workers)
+
+    def process(self, frame):
+        imgproc.draw_face_info(frame.image, frame.objects, frame.labels, frame.confidences, self.handle)
+
+
+class Pipeline:
+    """
+    A chain of stages, lazily pulling frames from a source. Each stage runs
+    the way its mode says: inline in the consuming thread, or on its own
+    thread or process pool, keeping the frames in order.
+    """
+    def __init__(self, *stages, config=None):
+        self.__stages = stages
+        self.__runtime = runtime.Runtime(config)
+        self.__timing = dict((s.name, 0.0) for s in stages)
+        self.__frames = 0
+
+    @property
+    def frames(self):
+        """
+        How many frames came out of the pipeline.
+        """
+        return self.__frames
+
+    @property
+    def timing(self):
+        """
+        Total seconds each stage spent on the frames that came out.
+        """
+        return self.__timing
+
+    def __call__(self, image, name=''):
+        """
+        Runs a single image through every stage inline, returning its frame.
+        """
+        frame = Frame(self.__frames, name, image)
+        for stage in self.__stages:
+            frame = stage(frame)
+        return self.__count(frame)
+
+    def run(self, source):
+        """
+        Yields the frames of a source, once they have been through every stage.
+        """
+        pools = []
+        frames = source
+
+        try:
+            for stage in self.__stages:
+                if stage.mode == THREAD:
+                    pool = self.__runtime.thread_pool(stage.workers)
+                    frames = archive.ordered_map(pool, stage, frames, 2 * stage.workers)
+                elif stage.mode == PROCESS:
+                    key = id(stage)
+                    pool = self.__runtime.process_pool(stage.workers, install, (key, stage))
+                    frames = archive.ordered_map(pool, functools.partial(call, key), frames, 2 * stage.workers)
+                else:
+                    pool = None
+                    frames = map(stage, frames)
+
+                if pool:
+                    pools.append(pool)
+
+            for frame in frames:
+                yield self.__count(frame)
+        finally:
+            for pool in pools:
+                pool.shutdown(wait=False)
+
+    def __count(self, frame):
+        self.__frames = self.__frames + 1
+        for name, seconds in frame.timing.items():
+            self.__timing[name] = self.__timing.get(name, 0.0) + seconds
+        return frame
+
+    def print_timing(self):
+        """
+        Displays the mean time spent per frame in each stage.
+        """
+        print('Pipeline Timing ({} frames):'.format(self.__frames))
+        for name, seconds in self.__timing.items():
+            print('  {}:\t{:.1f}ms'.format(name.capitalize(), seconds * 1000 / max(1, self.__frames)))
+
+
+def serial_config(config, *sections):
+    """
+    A copy of the settings with the threads of the given sections set to 1.
+    A stage running on a pool is already parallel, pools inside each of its
+    handles would oversubscribe the CPU.
+    """
+    names = config.sections() if isinstance(config, configuration.Config) else list(config)
+    copy = {name: dict(config[name]) for name in names}
+
+    for name in sections:
+        if name in copy:
+            copy[name]['threads'] = '1'
+
+    return copy
+
+
+def install(key, stage):
+    """
+    Process pool initializer, keeps the stage for the life of the worker.
+    """
+    __STAGES__[key] = stage
+
+
+def call(key, frame):
+    return __STAGES__[key](frame)
@@ -0,0 +1,133 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import collections
+import linecache
+import os
+import re
+import signal
+import sys
+import threading
+import time
+
+OPENCV_CALL = re.compile(r'(cv2\.[\w.]+|\.detectMultiScale|\.predict|\.train)\(')
+
+
+class Profiler:
+    """
+    Time-boxed sampling profiler of every thread in the process.
+    Nothing runs until it is started, by toggle() or the signal it is installed on.
+    Lines calling into OpenCV get an extra [cv2] frame, since the samples cannot
+    see inside C code.
+    """
+    def __init__(self, config):
+        try:
+            profiler = config['Profiler']
+        except KeyError as ke:
+            profiler = {}
+
+        self.__interval = float(profiler.get('interval', '5')) / 1000
+        self.__duration = float(profiler.get('duration', '10'))
+        self.__directory = profiler.get('directory', '.')
+        self.__top = int(profiler.get('top', '20'))
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    @property
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def install(self, signum=None):
+        """
+        Toggles the profiler whenever the process receives the signal (SIGUSR1 by default).
+        """
+        signum = signum or getattr(signal, 'SIGUSR1', None)
+        if signum is not None:
+            signal.signal(signum, lambda s, f: self.toggle())
+
+    def toggle(self):
+        if self.running:
+            self.__stop.set()
+        else:
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.__run, name='Profiler', daemon=True)
+            self.__thread.start()
+
+    def __run(self):
+        stacks = collections.Counter()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        start = time.monotonic()
+        samples = 0
+
+        print('Profiling for up to {:.0f}s...'.format(self.__duration))
+
+        while not self.__stop.wait(self.__interval) and time.monotonic() - start < self.__duration:
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    if ident not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    stacks[collapse(names.get(ident, str(ident)), frame)] += 1
+            samples = samples + 1
+
+        self.__write(stacks, samples, time.monotonic() - start)
+
+    def __write(self, stacks, samples, elapsed):
+        os.makedirs(self.__directory, exist_ok=True)
+        base = os.path.join(self.__directory, time.strftime('profile-%Y%m%d-%H%M%S'))
+        inclusive, exclusive = collections.Counter(), collections.Counter()
+
+        with open(base + '.folded', 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write('{} {}\n'.format(stack, count))
+                frames = stack.split(';')[1:]
+                exclusive[frames[-1] if frames else stack] += count
+                for name in set(frames):
+                    inclusive[name] += count
+
+        total = max(1, sum(stacks.values()))
+        lines = ['Profile: {} samples over {:.1f}s'.format(samples, elapsed), '', '  Self  Total  Function']
+        for name, count in exclusive.most_common(self.__top):
+            lines.append('{:5.1f}% {:5.1f}%  {}'.format(count * 100 / total, inclusive[name] * 100 / total, name))
+
+        with open(base + '.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        print('\n'.join(lines))
+        print('Profile saved: {}.folded'.format(base))
+
+
+def collapse(thread, frame):
+    """
+    Formats a stack as 'thread;outermost;...;innermost' for flamegraph.pl.
+    """
+    frames = []
+    leaf = frame
+
+    while frame is not None:
+        code = frame.f_code
+        frames.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+
+    frames.reverse()
+    match = OPENCV_CALL.search(linecache.getline(leaf.f_code.co_filename, leaf.f_lineno))
+    if match:
+        frames.append('[cv2] ' + match.group(1).lstrip('.'))
+
+    return ';'.join([thread] + frames)
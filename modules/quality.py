@@ -0,0 +1,111 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import re
+import time
+
+from . import imgproc
+
+DEFER_OVERLAP = 0.3
+
+
+class QualityGate:
+    """
+    Rejects faces that are too blurry, dark, flat, or small to be worth a prediction.
+    Thresholds come from the optional [Quality] section, without it every face passes.
+    """
+    def __init__(self, config):
+        try:
+            quality = config['Quality']
+        except KeyError as ke:
+            quality = None
+
+        self.__enabled = quality is not None
+        self.__results = []
+
+        if not self.__enabled:
+            return
+
+        detector = config['Detector']
+        minSize = tuple(map(int, re.split('\s*,\s*', detector['minSize'])))
+        brightness = tuple(map(float, re.split('\s*,\s*', quality.get('brightness', '0, 255'))))
+        scale = float(quality.get('size', '1.0'))
+
+        self.__sharpness = float(quality.get('sharpness', '0'))
+        self.__minBrightness, self.__maxBrightness = brightness
+        self.__contrast = float(quality.get('contrast', '0'))
+        self.__defer = float(quality.get('defer', '1.0'))
+        self.__minSize = (int(minSize[0] * scale), int(minSize[1] * scale))
+
+    @property
+    def enabled(self):
+        return self.__enabled
+
+    def check(self, frame, x, y, w, h, measured=None):
+        """
+        Returns the reason a face is rejected, or None if it passes.
+        measured may be the face's imgproc.measure_quality(), if already known.
+        """
+        if not self.__enabled:
+            return None
+
+        # Cheapest checks first
+        if w < self.__minSize[0] or h < self.__minSize[1]:
+            return 'small'
+
+        sharpness, brightness, contrast = measured or imgproc.measure_quality(frame, x, y, w, h)
+
+        if brightness < self.__minBrightness:
+            return 'dark'
+        elif brightness > self.__maxBrightness:
+            return 'bright'
+        elif contrast < self.__contrast:
+            return 'flat'
+        elif sharpness < self.__sharpness:
+            return 'blurry'
+
+        return None
+
+    def defer(self, box, now=None):
+        """
+        Finds the result of the previous frame for the face overlapping the most,
+        as long as the recognizer produced it no more than 'defer' seconds ago.
+        Returns a (label, confidence, time predicted) triple, or None.
+        """
+        now = now or time.monotonic()
+        best, overlap = None, DEFER_OVERLAP
+
+        for previous, label, confidence, predicted in self.__results:
+            iou = imgproc.intersection_over_union(box, previous)
+            if iou >= overlap and now - predicted <= self.__defer:
+                best, overlap = (label, confidence, predicted), iou
+
+        return best
+
+    def remember(self, objects, labels, confidences, predicted):
+        """
+        Keeps the results of a frame for deferring faces in the next one. predicted
+        is when each result was produced by the recognizer, None for a fresh one.
+        Deferred results keep their original time, so they expire.
+        """
+        now = time.monotonic()
+        self.__results = [
+            (tuple(box), label, confidence, when or now)
+            for box, label, confidence, when in zip(objects, labels, confidences, predicted)
+        ]
@@ -19,14 +19,20 @@
 
 import hashlib
 import os
+import queue
+import threading
+import time
 
-import numpy
-from PIL import Image
 import cv2
 
+from . import catalog
 from . import detection
 from . import imgproc
 from . import pathname
+from . import quality
+from . import runtime
+
+SKIPPED = 'Skipped'
 
 
 class Recognizer(detection.Detector):
@@ -34,66 +40,265 @@ class Recognizer(detection.Detector):
         super().__init__(classifier, config)
         camera = config['Camera']
         recognizer = config['Recognizer']
-        file_ = pathname.get_recognizer_file(label)
 
         self.__label = label
+        self.__file = pathname.get_recognizer_file(label)
         self.__hash = hash_label(label)
         self.__width = int(camera['width'])
         self.__height = int(camera['height'])
         self.__threshold = int(recognizer['threshold'])
         self.__rwidth = int(recognizer['width'])
         self.__rheight = int(recognizer['height'])
-        self.__recognizer = cv2.face.createLBPHFaceRecognizer(threshold=self.__threshold)
-        self.__recognizer.load(file_)
+        self.__gate = quality.QualityGate(config)
+        self.__skipped = []
+
+        # Faces of a frame can be recognized concurrently, OpenCV releases the GIL
+        manager = runtime.Runtime(config)
+        threads = int(recognizer.get('threads', str(manager.workers)))
+        self.__parallel = int(recognizer.get('parallel_threshold', '3'))
+        self.__executor = None
+        if threads > 1:
+            self.__executor = manager.thread_pool(threads)
+
+        # Up to one model handle per thread that may predict at the same time,
+        # only the first is loaded up front and the rest when needed, a reload
+        # parses as many as the pool in use has grown to
+        self.__handles = threads if threads > 1 else 1
+        self.__mtime = os.stat(self.__file).st_mtime_ns
+        self.__version = 1
+        self.__reload_seconds = 0.0
+        self.__pool = self.__load(1)
+        self.__pending = None
+
+        # Optionally watch the model file and swap in new versions
+        self.__stop = threading.Event()
+        self.__interval = float(recognizer.get('reload', '0'))
+        if self.__interval > 0:
+            threading.Thread(target=self.__watch, name='Model Watcher', daemon=True).start()
+
+    @property
+    def skipped(self):
+        """
+        The (box, reason) of each face the quality gate skipped in the last frame.
+        """
+        return self.__skipped
+
+    @property
+    def reload_seconds(self):
+        """
+        How long loading the most recent model took.
+        """
+        return self.__reload_seconds
+
+    @property
+    def version(self):
+        """
+        Starts at 1, incremented each time a changed model file is swapped in.
+        """
+        return self.__version
+
+    def close(self):
+        """
+        Stops watching the model file and shuts down the thread pools.
+        """
+        self.__stop.set()
+        if self.__executor:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        super().close()
 
     def recognize(self, frame):
-        confidences, labels = [], []
+        pool = self.__swap()
         objects = self.detect(frame)
 
-        for (x, y, w, h) in objects:
-            face = imgproc.preprocess(
-                frame,
-                self.__rwidth,
-                self.__rheight,
-                x, y, w, h
-            )
+        if self.__executor and len(objects) >= self.__parallel:
+            results = list(self.__executor.map(lambda box: self.__recognize_face(frame, box, pool), objects))
+        else:
+            results = [self.__recognize_face(frame, box, pool) for box in objects]
 
-            predicted_label, confidence = self.__recognizer.predict(face)
+        labels = [r[0] for r in results]
+        confidences = [r[1] for r in results]
+        self.__skipped = [(tuple(box), r[2]) for box, r in zip(objects, results) if r[2]]
 
-            if predicted_label == self.__hash:
-                labels.append(self.__label)
-                confidences.append(round(confidence))
-            else:
-                labels.append('Unknown')
-                confidences.append(-1)
+        if self.__gate.enabled:
+            # Faces skipped without a previous result have nothing worth deferring
+            kept = [(box, r) for box, r in zip(objects, results) if r[2] is None or r[3] is not None]
+            self.__gate.remember(
+                [box for box, r in kept],
+                [r[0] for box, r in kept],
+                [r[1] for box, r in kept],
+                [r[3] for box, r in kept]
+            )
 
         return (objects, labels, confidences)
 
+    def __load(self, count):
+        """
+        Parses the model file into a pool of count handles.
+        """
+        start = time.perf_counter()
+        pool = Handles(self.__label, self.__threshold, self.__handles, count)
+
+        self.__reload_seconds = time.perf_counter() - start
+        return pool
+
+    def __watch(self):
+        """
+        Polls the model file's mtime, loading changed models in the background.
+        """
+        while not self.__stop.wait(self.__interval):
+            try:
+                mtime = os.stat(self.__file).st_mtime_ns
+                if mtime == self.__mtime or self.__pending:
+                    continue
+
+                pool = self.__load(self.__pool.count)
+
+                # Only keep it if the file did not change while loading
+                if os.stat(self.__file).st_mtime_ns == mtime:
+                    self.__pending = pool
+                    self.__mtime = mtime
+            except (OSError, cv2.error) as error:
+                # Most likely still being written, try again next time
+                continue
+
+    def __recognize_face(self, frame, box, pool):
+        """
+        Returns the label, confidence, the reason it was skipped (if it was) of a face,
+        and when a deferred result was predicted (None for a fresh prediction).
+        """
+        (x, y, w, h) = box
+        reason = self.__gate.check(frame, x, y, w, h)
+
+        if reason:
+            # Not worth a prediction, reuse the last one for this face if any
+            deferred = self.__gate.defer((x, y, w, h))
+            if deferred:
+                return (deferred[0], deferred[1], reason, deferred[2])
+            return (SKIPPED, -1, reason, None)
+
+        face = imgproc.preprocess(
+            frame,
+            self.__rwidth,
+            self.__rheight,
+            x, y, w, h
+        )
+
+        label, confidence = self.__predict(face, pool)
+        return (label, confidence, None, None)
+
+    def predict(self, face):
+        """
+        Returns the label and confidence of an already preprocessed face.
+        """
+        return self.__predict(face, self.__swap())
+
+    def predict_faces(self, faces):
+        """
+        Returns the labels and confidences of the preprocessed faces of one frame,
+        all predicted by the same model. Faces that are None are skipped.
+        """
+        pool = self.__swap()
+        results = [self.__predict(face, pool) if face is not None else (SKIPPED, -1) for face in faces]
+        return ([r[0] for r in results], [r[1] for r in results])
+
+    def __swap(self):
+        """
+        Swaps in a reloaded model between frames, never during one.
+        """
+        if self.__pending:
+            self.__pool, self.__pending = self.__pending, None
+            self.__version = self.__version + 1
+
+        return self.__pool
+
+    def __predict(self, face, pool):
+        # Each concurrent prediction borrows its own handle
+        recognizer = pool.get()
+        try:
+            predicted_label, confidence = recognizer.predict(face)
+        finally:
+            pool.put(recognizer)
+
+        if predicted_label == self.__hash:
+            return (self.__label, round(confidence))
+        else:
+            return ('Unknown', -1)
+
     def recognize_from_file(self, path):
-        image_pil = Image.open(path)
-        image_org = numpy.array(image_pil)
-        image_rgb = cv2.cvtColor(image_org, cv2.COLOR_BGR2RGB)
-        ar_height = int(self.__width / (image_pil.size[0] / image_pil.size[1]))
-        image = cv2.resize(image_rgb, (self.__width, ar_height))
+        image = imgproc.read_image(path, self.__width)
         objects, labels, confidences = self.recognize(image)
         return (image, objects, labels, confidences)
 
 
+class Handles:
+    """
+    A pool of handles of one model, grown one handle at a time (up to a limit)
+    whenever every handle is busy, so unused threads never cost a model parse.
+    The first count handles are loaded up front.
+    """
+    def __init__(self, label, threshold, limit, count=1):
+        self.__label = label
+        self.__threshold = threshold
+        self.__limit = limit
+        self.__lock = threading.Lock()
+        self.__queue = queue.Queue()
+        self.__count = max(1, min(count, limit))
+        for i in range(self.__count):
+            self.__queue.put(load_model(label, threshold))
+
+    @property
+    def count(self):
+        """
+        How many handles have been loaded.
+        """
+        return self.__count
+
+    def get(self):
+        try:
+            return self.__queue.get_nowait()
+        except queue.Empty as qe:
+            with self.__lock:
+                grow = self.__count < self.__limit
+                if grow:
+                    self.__count = self.__count + 1
+            if grow:
+                return load_model(self.__label, self.__threshold)
+            return self.__queue.get()
+
+    def put(self, handle):
+        self.__queue.put(handle)
+
+
 def identify(frame, classifier, config):
     identities = []
 
-    for f in os.listdir(pathname.get_recognizer_root()):
-        if f.endswith('.xml'):
-            label = f.split('.')[0]
-            recognizer = Recognizer(classifier, label, config)
+    for label in catalog.get().recognizer_labels():
+        recognizer = Recognizer(classifier, label, config)
+        try:
             image, objects, labels, confidences = recognizer.recognize_from_file(frame)
+        finally:
+            recognizer.close()
 
-            if len(labels) > 0:
-                identities.append((labels[0], confidences[0]))
+        if len(labels) > 0:
+            identities.append((labels[0], confidences[0]))
 
     return sorted(identities, key=lambda face: face[1])
 
 
+def load_model(label, threshold):
+    """
+    Loads the LBPH model of a label.
+    """
+    model = cv2.face.createLBPHFaceRecognizer(threshold=threshold)
+    model.load(pathname.get_recognizer_file(label))
+    return model
+
+
+def is_identified(label):
+    return label not in ['Unknown', SKIPPED]
+
+
 def hash_label(label):
     sha1 = hashlib.sha1(label.encode())
     return int(sha1.hexdigest(), 16) % (10 ** 8)
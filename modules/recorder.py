@@ -0,0 +1,179 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import collections
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+FOURCC = 'MJPG'
+EXTENSION = '.avi'
+
+# Weight of the newest frame interval in the measured frame rate
+RATE_SMOOTHING = 0.05
+
+
+class Recorder:
+    """
+    Writes annotated frames to video clips on a background thread.
+    A clip starts (with a pre-roll of earlier frames) when triggered and ends
+    a post-roll after the last trigger. Clips are split into segments by
+    duration and size. Frames are dropped, never waited on, when the writer
+    falls behind; the pre-roll is handed over as one item so it never crowds
+    out the frames that triggered the clip. Clips are written at the measured rate frames are handed in,
+    so they play back in real time.
+    """
+    def __init__(self, directory, config):
+        try:
+            recorder = config['Recorder']
+        except KeyError as ke:
+            recorder = {}
+
+        self.__directory = directory
+        self.__fps = float(recorder.get('fps', '15'))
+        self.__segment_seconds = float(recorder.get('segment_seconds', '300'))
+        self.__segment_bytes = int(float(recorder.get('segment_megabytes', '512')) * 2**20)
+        self.__postroll = float(recorder.get('postroll', '3'))
+        self.__preroll_seconds = float(recorder.get('preroll', '3'))
+        preroll_frames = int(recorder.get('preroll_frames', '30'))
+        queue_size = int(recorder.get('queue', '64'))
+
+        # Full frames are large, the pre-roll is capped by count as well as age
+        self.__preroll = collections.deque(maxlen=max(1, preroll_frames))
+        self.__last = None
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__until = 0.0
+        self.__clip = 0
+        self.__recording = False
+        self.__dropped = 0
+        self.__written = 0
+        self.__segments = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.__thread = threading.Thread(target=self.__run, name='Recorder', daemon=True)
+        self.__thread.start()
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def fps(self):
+        """
+        The measured rate frames are written at, until measured the 'fps' setting.
+        """
+        return self.__fps
+
+    @property
+    def recording(self):
+        return self.__recording
+
+    @property
+    def segments(self):
+        return self.__segments
+
+    @property
+    def written(self):
+        return self.__written
+
+    def write(self, frame, triggered=False):
+        """
+        Hands a frame to the recorder without blocking.
+        The frame must not be modified afterwards.
+        """
+        now = time.monotonic()
+
+        if self.__last is not None and now > self.__last:
+            self.__fps = self.__fps + RATE_SMOOTHING * (1.0 / (now - self.__last) - self.__fps)
+        self.__last = now
+
+        if triggered:
+            self.__until = now + self.__postroll
+
+        if now < self.__until:
+            if not self.__recording:
+                self.__recording = True
+                self.__clip = self.__clip + 1
+                self.__put([f for t, f in self.__preroll])
+                self.__preroll.clear()
+            self.__put([frame])
+        else:
+            self.__recording = False
+            self.__preroll.append((now, frame))
+
+            # Keep the pre-roll by age, the frame rate depends on the host
+            while self.__preroll and now - self.__preroll[0][0] > self.__preroll_seconds:
+                self.__preroll.popleft()
+
+    def close(self):
+        """
+        Flushes the queued frames and stops the writer thread.
+        """
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def __put(self, frames):
+        if len(frames) == 0:
+            return
+        try:
+            self.__queue.put_nowait((self.__clip, frames))
+        except queue.Full:
+            self.__dropped = self.__dropped + len(frames)
+
+    def __open(self, frame):
+        name = time.strftime('retina-%Y%m%d-%H%M%S') + '-{:d}'.format(self.__segments) + EXTENSION
+        path = os.path.join(self.__directory, name)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FOURCC), self.__fps, (frame.shape[1], frame.shape[0]))
+        self.__segments = self.__segments + 1
+        return (writer, path, time.monotonic())
+
+    def __run(self):
+        writer, path, opened = None, None, 0.0
+        clip, frames, checked = 0, 0, 0
+
+        while True:
+            item = self.__queue.get()
+
+            if item is None:
+                break
+
+            # Start a new file for a new clip, or when the segment is full
+            if writer is not None:
+                full = time.monotonic() - opened >= self.__segment_seconds
+                if not full and frames - checked >= max(1, int(self.__fps)):
+                    checked = frames
+                    full = os.path.getsize(path) >= self.__segment_bytes
+                if item[0] != clip or full:
+                    writer.release()
+                    writer = None
+
+            if writer is None:
+                writer, path, opened = self.__open(item[1][0])
+                clip, frames, checked = item[0], 0, 0
+
+            for frame in item[1]:
+                writer.write(frame)
+            frames = frames + len(item[1])
+            self.__written = self.__written + len(item[1])
+
+        if writer is not None:
+            writer.release()
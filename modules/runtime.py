@@ -0,0 +1,124 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+
+import cv2
+
+# Threads of every pool in this process take core slices in turn,
+# so two pools never pin their first threads to the same cores
+__THREADS__ = itertools.count()
+
+
+class Runtime:
+    """
+    Splits the cores of the host between OpenCV's own threads and our worker pools,
+    so the two never oversubscribe the CPU. Settings come from the optional [Runtime]
+    section, anything missing is derived from the number of usable cores.
+    """
+    def __init__(self, config=None):
+        try:
+            runtime = config['Runtime'] if config else {}
+        except KeyError as ke:
+            runtime = {}
+
+        if hasattr(os, 'sched_getaffinity'):
+            self.__cores = sorted(os.sched_getaffinity(0))
+        else:
+            self.__cores = list(range(os.cpu_count() or 1))
+
+        count = len(self.__cores)
+        self.__workers = max(1, int(runtime.get('workers', str(count // 2))))
+        self.__opencv_threads = int(runtime.get('opencv_threads', str(max(1, count // self.__workers))))
+        self.__affinity = runtime.get('affinity', 'no').lower() in ['yes', 'true', 'on', '1']
+
+    def __str__(self):
+        return '{} cores: {} workers, {} OpenCV threads{}'.format(
+            len(self.__cores), self.__workers, self.__opencv_threads,
+            ', pinned' if self.__affinity else '')
+
+    @property
+    def cores(self):
+        return len(self.__cores)
+
+    @property
+    def opencv_threads(self):
+        return self.__opencv_threads
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    def apply(self, opencv_threads=None):
+        """
+        Sets the number of threads OpenCV's parallel loops may use.
+        """
+        cv2.setNumThreads(opencv_threads or self.__opencv_threads)
+        return self
+
+    def pin(self, index, width=1):
+        """
+        Pins the calling thread (or process) to its own slice of cores.
+        Does nothing unless 'affinity' is enabled.
+        """
+        if not self.__affinity or not hasattr(os, 'sched_setaffinity'):
+            return
+        start = (index * width) % len(self.__cores)
+        cores = set(self.__cores[start: start + width]) or {self.__cores[start]}
+        os.sched_setaffinity(0, cores)
+
+    def thread_pool(self, workers):
+        """
+        Creates a thread pool whose threads are pinned one core each.
+        """
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers,
+            initializer=lambda: self.pin(next(__THREADS__))
+        )
+
+    def process_pool(self, workers, initializer=None, initargs=()):
+        """
+        Creates a process pool, each process gets an equal share of the cores
+        for OpenCV and is pinned to it.
+        """
+        counter = multiprocessing.Value('i', 0)
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=start_worker,
+            initargs=(self, workers, counter, initializer, initargs)
+        )
+
+
+def start_worker(runtime, workers, counter, initializer, initargs):
+    """
+    Process pool initializer, see Runtime.process_pool().
+    """
+    with counter.get_lock():
+        index = counter.value
+        counter.value = counter.value + 1
+
+    width = max(1, runtime.cores // workers)
+    runtime.apply(width)
+    runtime.pin(index, width)
+
+    if initializer:
+        initializer(*initargs)
@@ -0,0 +1,382 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy
+
+from . import pipeline
+from . import recognition
+
+# Every message is two lengths, a JSON header and a binary payload
+HEADER = struct.Struct('!II')
+
+# Seconds a local worker may take to load its models
+STARTUP_TIMEOUT = 120
+
+
+class Worker:
+    """
+    Holds the models of one shard of the labels warm and answers
+    identify requests for preprocessed faces over TCP.
+    """
+    def __init__(self, labels, config, address='127.0.0.1:0', shard=0):
+        threshold = int(config['Recognizer']['threshold'])
+        self.__shard = shard
+        self.__labels = list(labels)
+        self.__models = [
+            (label, recognition.hash_label(label), recognition.load_model(label, threshold))
+            for label in self.__labels
+        ]
+
+        # LBPH handles are not safe to share, requests take turns
+        self.__lock = threading.Lock()
+        self.__server = socketserver.ThreadingTCPServer(parse_address(address), Handler)
+        self.__server.daemon_threads = True
+        self.__server.worker = self
+
+    @property
+    def address(self):
+        host, port = self.__server.server_address[:2]
+        return '{}:{}'.format(host, port)
+
+    @property
+    def labels(self):
+        return self.__labels
+
+    @property
+    def shard(self):
+        return self.__shard
+
+    def identify(self, faces):
+        """
+        Returns the best label and confidence in this shard for each face.
+        """
+        labels, confidences = [], []
+
+        with self.__lock:
+            for face in faces:
+                best = ('Unknown', -1)
+                for label, hash_, model in self.__models:
+                    predicted, confidence = model.predict(face)
+                    if predicted == hash_ and (best[1] < 0 or confidence < best[1]):
+                        best = (label, round(confidence))
+                labels.append(best[0])
+                confidences.append(best[1])
+
+        return (labels, confidences)
+
+    def serve_forever(self):
+        self.__server.serve_forever()
+
+    def close(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class Handler(socketserver.BaseRequestHandler):
+    """
+    Answers the requests of one coordinator connection, in order.
+    """
+    def handle(self):
+        worker = self.server.worker
+
+        while True:
+            try:
+                header, payload = receive(self.request)
+            except (ConnectionError, OSError) as error:
+                return
+
+            reply = {'id': header.get('id'), 'shard': worker.shard}
+
+            try:
+                if header.get('op') == 'identify':
+                    start = time.perf_counter()
+                    count, height, width = header['shape']
+                    faces = numpy.frombuffer(payload, numpy.uint8).reshape((count, height, width))
+                    reply['labels'], reply['confidences'] = worker.identify(faces)
+                    reply['seconds'] = time.perf_counter() - start
+                elif header.get('op') == 'info':
+                    reply['labels'] = worker.labels
+                else:
+                    reply['error'] = 'Unknown request \"{}\"'.format(header.get('op'))
+            except (KeyError, ValueError, TypeError) as error:
+                reply['error'] = 'Malformed request: {}'.format(error)
+
+            send(self.request, reply)
+
+
+class Connection:
+    """
+    A coordinator's connection to one worker, reopened after any failure
+    so a late reply can never be mistaken for the answer to a new request.
+    """
+    def __init__(self, address):
+        self.address = address
+        self.__socket = None
+        self.__lock = threading.Lock()
+
+    def request(self, header, payload, deadline):
+        # A previous request that is still waiting on this worker holds the lock
+        if not self.__lock.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise TimeoutError('{} is busy'.format(self.address))
+
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError('{} timed out'.format(self.address))
+
+            if self.__socket is None:
+                self.__socket = socket.create_connection(parse_address(self.address), timeout=remaining)
+                self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            self.__socket.settimeout(remaining)
+            send(self.__socket, header, payload)
+            reply, _ = receive(self.__socket)
+
+            if reply.get('id') != header['id']:
+                raise ConnectionError('{} answered out of order'.format(self.address))
+            if 'error' in reply:
+                raise ConnectionError('{}: {}'.format(self.address, reply['error']))
+
+            return reply
+        except (OSError, ValueError) as error:
+            self.close()
+            raise
+        finally:
+            self.__lock.release()
+
+    def close(self):
+        if self.__socket:
+            self.__socket.close()
+            self.__socket = None
+
+
+class Coordinator:
+    """
+    Detects and preprocesses the faces of a frame once, asks every shard's worker
+    for its best matches, and keeps the best of all. Shards that do not answer
+    within the timeout are left out and reported as missing.
+    """
+    def __init__(self, addresses, classifier, config):
+        settings = shards_settings(config)
+        self.__timeout = float(settings.get('timeout', '2.0'))
+        self.__connections = [Connection(address) for address in addresses]
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(addresses))
+        self.__ids = itertools.count(1)
+        self.__chain = pipeline.Pipeline(
+            pipeline.Detect(classifier, config),
+            pipeline.Preprocess(config),
+            config=config
+        )
+
+    @property
+    def timeout(self):
+        return self.__timeout
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
+        for connection in self.__connections:
+            connection.close()
+
+    def check(self, expected=None):
+        """
+        Asks every worker for its labels and raises a ValueError unless no
+        label is served twice and, when given, every expected label is served.
+        """
+        served = {}
+        deadline = time.monotonic() + self.__timeout
+
+        for connection in self.__connections:
+            reply = connection.request({'id': next(self.__ids), 'op': 'info'}, b'', deadline)
+            for label in reply['labels']:
+                if label in served:
+                    raise ValueError('"{}" is served by both {} and {}'.format(label, served[label], connection.address))
+                served[label] = connection.address
+
+        missing = sorted(set(expected or []) - set(served))
+        if len(missing) > 0:
+            raise ValueError('No worker serves {}'.format(', '.join(missing)))
+
+        return len(served)
+
+    def recognize(self, frame):
+        """
+        Returns the boxes, labels and confidences of the faces in a frame,
+        and the addresses of the shards that did not answer in time.
+        """
+        processed = self.__chain(frame)
+        faces = [face for face in processed.faces if face is not None]
+        labels, confidences, missing = self.identify(faces)
+
+        # Faces the quality gate skipped were never sent
+        results = iter(zip(labels, confidences))
+        labels, confidences = [], []
+        for face in processed.faces:
+            label, confidence = next(results) if face is not None else (recognition.SKIPPED, -1)
+            labels.append(label)
+            confidences.append(confidence)
+
+        return (processed.objects, labels, confidences, missing)
+
+    def identify(self, faces):
+        """
+        Returns the best label and confidence over every shard for each
+        preprocessed face, and the addresses of the shards that did not answer.
+        """
+        if len(faces) == 0:
+            return ([], [], [])
+
+        header = {'id': next(self.__ids), 'op': 'identify', 'shape': [len(faces)] + list(faces[0].shape)}
+        payload = numpy.ascontiguousarray(numpy.stack(faces), numpy.uint8).tobytes()
+        deadline = time.monotonic() + self.__timeout
+
+        futures = {
+            self.__executor.submit(c.request, header, payload, deadline): c
+            for c in self.__connections
+        }
+        done, pending = concurrent.futures.wait(futures, timeout=self.__timeout)
+
+        best = [('Unknown', -1)] * len(faces)
+        missing = [futures[f].address for f in pending]
+
+        for future in done:
+            try:
+                reply = future.result()
+            except (OSError, ValueError) as error:
+                missing.append(futures[future].address)
+                continue
+
+            for i, (label, confidence) in enumerate(zip(reply['labels'], reply['confidences'])):
+                if recognition.is_identified(label) and (best[i][1] < 0 or confidence < best[i][1]):
+                    best[i] = (label, confidence)
+
+        return ([b[0] for b in best], [b[1] for b in best], sorted(missing))
+
+
+def send(sock, header, payload=b''):
+    data = json.dumps(header).encode()
+    sock.sendall(HEADER.pack(len(data), len(payload)) + data + payload)
+
+
+def receive(sock):
+    size, length = HEADER.unpack(receive_exactly(sock, HEADER.size))
+    header = json.loads(receive_exactly(sock, size).decode())
+    return (header, receive_exactly(sock, length))
+
+
+def receive_exactly(sock, size):
+    data = bytearray()
+
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 2**20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        data.extend(chunk)
+
+    return bytes(data)
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def shard_of(label, shards):
+    """
+    The shard a label belongs to, stable across hosts and runs.
+    """
+    return recognition.hash_label(label) % shards
+
+
+def partition(labels, shards):
+    """
+    Splits labels into the given number of shards.
+    """
+    partitions = [[] for i in range(shards)]
+    for label in sorted(labels):
+        partitions[shard_of(label, shards)].append(label)
+    return partitions
+
+
+def start_local(partitions, config):
+    """
+    Starts a worker process on a free local port for each partition,
+    as stand-ins for separate hosts. Returns the processes and their addresses.
+    """
+    ready = multiprocessing.Queue()
+    processes = []
+
+    for shard, labels in enumerate(partitions):
+        process = multiprocessing.Process(target=run_worker, args=(labels, config, '127.0.0.1:0', shard, ready), daemon=True)
+        process.start()
+        processes.append(process)
+
+    # Loading the models is what takes the time, a worker that dies doing so never reports
+    addresses = {}
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+
+    while len(addresses) < len(processes):
+        try:
+            shard, address = ready.get(timeout=0.5)
+            addresses[shard] = address
+            continue
+        except queue.Empty as qe:
+            pass
+
+        waiting = [shard for shard in range(len(processes)) if shard not in addresses]
+        failed = [shard for shard in waiting if not processes[shard].is_alive()]
+
+        if len(failed) > 0 or time.monotonic() > deadline:
+            for process in processes:
+                process.terminate()
+            if len(failed) > 0:
+                raise RuntimeError('Shard {} exited with code {} while loading'.format(
+                    failed[0], processes[failed[0]].exitcode))
+            raise TimeoutError('Shard {} not ready after {}s'.format(
+                ', '.join(map(str, waiting)), STARTUP_TIMEOUT))
+
+    return (processes, [addresses[shard] for shard in range(len(partitions))])
+
+
+def run_worker(labels, config, address, shard, ready=None):
+    """
+    Serves a shard until the process is stopped.
+    """
+    worker = Worker(labels, config, address, shard)
+    if ready:
+        ready.put((shard, worker.address))
+    worker.serve_forever()
+
+
+def shards_settings(config):
+    try:
+        return config['Shards']
+    except KeyError as ke:
+        return {}
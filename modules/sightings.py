@@ -0,0 +1,215 @@
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sightings (
+        id INTEGER PRIMARY KEY,
+        label TEXT NOT NULL,
+        camera TEXT NOT NULL,
+        track INTEGER NOT NULL,
+        start REAL NOT NULL,
+        end REAL NOT NULL,
+        frames INTEGER NOT NULL,
+        confidence INTEGER NOT NULL,
+        x INTEGER, y INTEGER, w INTEGER, h INTEGER
+    )""",
+    'CREATE INDEX IF NOT EXISTS sightings_label_end ON sightings (label, end)',
+    'CREATE INDEX IF NOT EXISTS sightings_end ON sightings (end)',
+    # Running totals, so per-label counts never scan the sightings
+    """CREATE TABLE IF NOT EXISTS labels (
+        label TEXT PRIMARY KEY,
+        sightings INTEGER NOT NULL,
+        seconds REAL NOT NULL,
+        last_seen REAL NOT NULL
+    )"""
+]
+
+
+def connect(path):
+    """
+    Opens (creating if needed) a sightings database in WAL mode,
+    so queries never wait on the writer.
+    """
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    for statement in SCHEMA:
+        db.execute(statement)
+    db.commit()
+    return db
+
+
+def last_seen(db, label):
+    """
+    Returns (start, end, camera) of the label's latest sighting, or None.
+    """
+    return db.execute(
+        'SELECT start, end, camera FROM sightings WHERE label = ? ORDER BY end DESC LIMIT 1',
+        (label,)
+    ).fetchone()
+
+
+def counts(db, since=None):
+    """
+    Returns (label, sightings, seconds, last seen) for each label,
+    optionally only counting sightings that ended after 'since'.
+    """
+    if since is None:
+        return db.execute('SELECT label, sightings, seconds, last_seen FROM labels ORDER BY label').fetchall()
+
+    return db.execute(
+        'SELECT label, COUNT(*), SUM(end - start), MAX(end) FROM sightings '
+        'WHERE end >= ? GROUP BY label ORDER BY label',
+        (since,)
+    ).fetchall()
+
+
+class Store:
+    """
+    Records sightings from a background writer thread that batches them into
+    transactions. Consecutive sightings of a label by the same track are
+    coalesced into one interval while they are less than 'gap' seconds apart.
+    record() never blocks, sightings are dropped if the writer falls behind.
+    """
+    def __init__(self, path, config):
+        try:
+            sightings = config['Sightings']
+        except KeyError as ke:
+            sightings = {}
+
+        self.__path = path
+        self.__batch = int(sightings.get('batch', '500'))
+        self.__interval = float(sightings.get('interval', '1.0'))
+        self.__gap = float(sightings.get('gap', '2.0'))
+        self.__queue = queue.Queue(maxsize=int(sightings.get('queue', '10000')))
+        self.__dropped = 0
+        self.__written = 0
+
+        connect(path).close()
+        self.__thread = threading.Thread(target=self.__run, name='Sightings Writer', daemon=True)
+        self.__thread.start()
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def written(self):
+        return self.__written
+
+    def record(self, camera, track, label, confidence, box, now=None):
+        try:
+            self.__queue.put_nowait((camera, track, label, int(confidence), tuple(int(v) for v in box), now or time.time()))
+        except queue.Full:
+            self.__dropped = self.__dropped + 1
+
+    def close(self):
+        """
+        Writes the remaining sightings and stops the writer thread.
+        """
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        db = connect(self.__path)
+        intervals = {}
+        closing = False
+
+        while not closing:
+            deadline = time.monotonic() + self.__interval
+            count = 0
+
+            while count < self.__batch:
+                try:
+                    item = self.__queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    closing = True
+                    break
+
+                self.__add(intervals, item)
+                count = count + 1
+
+            self.__flush(db, intervals, time.time(), closing)
+
+        db.close()
+
+    def __add(self, intervals, item):
+        camera, track, label, confidence, box, now = item
+        key = (camera, track, label)
+        interval = intervals.get(key)
+
+        if interval and now - interval['end'] <= self.__gap:
+            interval['end'] = now
+            interval['frames'] = interval['frames'] + 1
+            interval['confidence'] = min(interval['confidence'], confidence)
+            interval['box'] = box
+            interval['dirty'] = True
+        else:
+            # A new interval, the old one (if any) is final once flushed
+            if interval:
+                intervals[key + (interval['start'],)] = interval
+            intervals[key] = {
+                'id': None, 'start': now, 'end': now, 'written': now, 'frames': 1,
+                'confidence': confidence, 'box': box, 'dirty': True
+            }
+
+    def __flush(self, db, intervals, now, closing):
+        with db:
+            for key, interval in list(intervals.items()):
+                camera, track, label = key[0:3]
+
+                if interval['dirty']:
+                    x, y, w, h = interval['box']
+                    if interval['id'] is None:
+                        cursor = db.execute(
+                            'INSERT INTO sightings (label, camera, track, start, end, frames, confidence, x, y, w, h) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (label, camera, track, interval['start'], interval['end'], interval['frames'],
+                             interval['confidence'], x, y, w, h)
+                        )
+                        interval['id'] = cursor.lastrowid
+                        new = 1
+                    else:
+                        db.execute(
+                            'UPDATE sightings SET end = ?, frames = ?, confidence = ?, x = ?, y = ?, w = ?, h = ? WHERE id = ?',
+                            (interval['end'], interval['frames'], interval['confidence'], x, y, w, h, interval['id'])
+                        )
+                        new = 0
+
+                    db.execute(
+                        'INSERT INTO labels (label, sightings, seconds, last_seen) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT (label) DO UPDATE SET sightings = sightings + excluded.sightings, '
+                        'seconds = seconds + excluded.seconds, last_seen = MAX(last_seen, excluded.last_seen)',
+                        (label, new, interval['end'] - interval['written'], interval['end'])
+                    )
+                    interval['written'] = interval['end']
+                    interval['dirty'] = False
+                    self.__written = self.__written + 1
+
+                # Nothing can extend it any more
+                if closing or len(key) > 3 or now - interval['end'] > self.__gap:
+                    del intervals[key]
@@ -19,19 +19,16 @@
 # If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
 #######################################################################
 
+import time
+
+__START__ = time.perf_counter()
+
 import getopt
 import os
 import sys
-import time
-
-import cv2
 
-from modules import camera
 from modules import configuration
-from modules import imgproc
-from modules import misc
 from modules import opt
-from modules import recognition
 
 
 def print_usage(message=None):
@@ -39,7 +36,7 @@ def print_usage(message=None):
     Displays program usage information.
     """
     if message: print('>>>', message, end=' <<<\n')
-    print('Usage:\t./retina.py [-c PATH] [-f PATH] [-i INDEX] --label=NAME [-s NAME]')
+    print('Usage:\t./retina.py [-c PATH] [-f PATH] [-i INDEX] --label=NAME [-s NAME] [--headless] [--timing] [--record=DIR] [--events=SINK] [--sightings]')
     print('  -h --help\t\tPrints this text')
     print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier (Optional)')
     print('  -f --file=PATH\tPath to a still image (alternative to camera stream)')
@@ -48,22 +45,43 @@ def print_usage(message=None):
     print('  -l --label=NAME\tThe name of the person\'s face to recognize')
     print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
     print('                 \tSee \'settings/\', without \'.txt\' extension')
+    print('  -H --headless\t\tNever open a window, results are printed instead')
+    print('  -t --timing\t\tReports how long startup took, up to the first result')
+    print('  -r --record=DIR\tSaves clips of recognized faces under DIR (camera stream only)')
+    print('  -e --events=SINK\tPublishes face events as JSON lines (camera stream only)')
+    print('                 \tSINK is \'file:PATH\', \'unix:PATH\', or \'tcp:HOST:PORT\'')
+    print('  -k --sightings\t\tStores who was recognized and when in \'data/sightings.db\'')
     exit(0)
 
 
+def print_timing(marks):
+    """
+    Displays the time spent in each stage of startup.
+    """
+    previous = __START__
+    print('Startup Timing:')
+    for stage, t in marks:
+        print('  {}:\t{:.3f}s'.format(stage, t - previous))
+        previous = t
+    print('  Total:\t{:.3f}s'.format(previous - __START__))
+
+
 def main():
     """
     Main function.
     """
     classifier, label, path = None, None, None
-    flags, index = 0, 0
-    settings = opt.map_settings()
+    index = 0
+    headless, timing = False, False
+    record, sink = None, None
+    history = False
     key = opt.default_settings()
+    marks = []
 
     # Parse command-line arguments
     try:
-        short_opts = 'hc:f:i:l:s:'
-        long_opts = ['help', 'classifier=', 'file=', 'input=', 'label=', 'settings=']
+        short_opts = 'hc:f:i:l:s:Htr:e:k'
+        long_opts = ['help', 'classifier=', 'file=', 'input=', 'label=', 'settings=', 'headless', 'timing', 'record=', 'events=', 'sightings']
         opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
     except getopt.GetoptError as error:
         print_usage('Invalid argument: \"{}\"'.format(str(error)))
@@ -76,62 +94,286 @@ def main():
         elif o == '-i' or o == '--input':       index = int(a)
         elif o == '-l' or o == '--label':       label = opt.validate_recognizer(a)
         elif o == '-s' or o == '--settings':    key = a
+        elif o == '-H' or o == '--headless':    headless = True
+        elif o == '-t' or o == '--timing':      timing = True
+        elif o == '-r' or o == '--record':      record = a
+        elif o == '-e' or o == '--events':      sink = a
+        elif o == '-k' or o == '--sightings':   history = True
+
+    settings = opt.find_settings(key)
 
     if len(opts) == 0:
         print_usage()
-    elif key not in settings.keys():
+    elif not settings:
         print_usage('Settings file \"{}\" not found'.format(key))
+    elif not path and not label:
+        print_usage('Label not specified')
 
     # Initialize variables
-    config = configuration.Config(settings[key])
-    stream = camera.Camera(index, config)
-    dwidth, dheight = misc.get_display_resolution()
-    window_name = str(stream)
+    config = configuration.Config(settings)
+    marks.append(('Settings', time.perf_counter()))
+
+    # Heavy modules are only imported once we know they are needed
+    from modules import recognition
+    from modules import runtime
+    manager = runtime.Runtime(config).apply()
+    marks.append(('Imports', time.perf_counter()))
+    if timing: print('Runtime:', manager)
 
     if path and not label:
         # Identify face in image
         identities = recognition.identify(path, classifier, config)
+        marks.append(('Identification', time.perf_counter()))
         if len(identities) > 0:
             for i in identities: print(i)
         else:
             print('No faces detected in:', path)
+        if timing: print_timing(marks)
         return
     elif path and label:
         # Recognize in a still image
         recognizer = recognition.Recognizer(classifier, label, config)
         image, objects, labels, confidences = recognizer.recognize_from_file(path)
-        imgproc.draw_face_info(image, objects, labels, confidences)
-        cv2.imshow(path, image)
-        cv2.waitKey(0)
+        marks.append(('Recognition', time.perf_counter()))
+        if timing: print_timing(marks)
+
+        if headless:
+            for i, (x, y, w, h) in enumerate(objects):
+                print((labels[i], confidences[i]), '{:d}x{:d}+{:d}+{:d}'.format(w, h, x, y))
+            if len(objects) == 0:
+                print('No faces detected in:', path)
+        else:
+            import cv2
+            from modules import imgproc
+            imgproc.draw_face_info(image, objects, labels, confidences)
+            cv2.imshow(path, image)
+            cv2.waitKey(0)
         return
-    elif not path and not label:
-        print_usage('Label not specified')
-    else:
-        print('Capture resolution: {:d}x{:d}'.format(stream.width, stream.height))
+
+    import cv2
+    from modules import camera
+
+    stream = camera.Camera(index, config)
+    window_name = str(stream)
+    print('Capture resolution: {:d}x{:d}'.format(stream.width, stream.height))
+
+    if not headless:
+        from modules import misc
+        dwidth, dheight = misc.get_display_resolution()
         cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
         cv2.moveWindow(window_name, (dwidth - stream.width) // 2, 0)
 
-        if not stream.open():
-            print('Failed to open Camera', index)
-            exit(1)
+    if not stream.open():
+        print('Failed to open Camera', index)
+        exit(1)
 
     recognizer = recognition.Recognizer(classifier, label, config)
+    video, publisher, tracker, store = None, None, None, None
+
+    if record:
+        from modules import recorder
+        video = recorder.Recorder(record, config)
+
+    if sink or history:
+        from modules import events
+        tracker = events.Tracker(config)
+
+    if sink:
+        publisher = events.Publisher(sink, config)
+
+    if history:
+        from modules import pathname
+        from modules import sightings
+        store = sightings.Store(pathname.get_sightings_file(), config)
+
+    # Sending SIGUSR1 (or pressing 'p') toggles a sampling profile of the loop
+    from modules import profiler
+    sampler = profiler.Profiler(config)
+    sampler.install()
+
+    # Recognition, then events and sightings, for every frame processed
+    from modules import pipeline
+    outputs = (tracker, publisher, store)
+    detection = {'frames': 0, 'proposal': 0.0, 'verification': 0.0, 'candidates': 0, 'verified': 0}
+    chain = pipeline.Pipeline(
+        pipeline.Recognize.using(recognizer),
+        pipeline.Call(lambda frame: accumulate(detection, recognizer.timing)),
+        pipeline.Call(lambda frame: publish(frame, outputs)),
+        config=config
+    )
+
+    marks.append(('Initialization', time.perf_counter()))
+
+    try:
+        if headless:
+            run_headless(stream, chain, recognizer, video, timing, marks)
+        else:
+            from modules import display
+            run_window(stream, chain, recognizer, video, sampler, window_name, display.get_fps(config), timing, marks)
+    finally:
+        recognizer.close()
+        if timing:
+            chain.print_timing()
+            print_detection_timing(detection)
+        if video:
+            video.close()
+            print('Recorded {} frames in {} segments, {} dropped'.format(
+                video.written, video.segments, video.dropped))
+        if publisher:
+            publisher.close()
+            print('Published {} events, {} coalesced, {} dropped'.format(
+                publisher.published, publisher.coalesced, publisher.dropped))
+        if store:
+            store.close()
+            print('Stored {} sightings, {} dropped'.format(store.written, store.dropped))
+
+
+def publish(frame, outputs):
+    """
+    Passes the faces recognized in a frame on to the event and sightings outputs.
+    """
+    from modules import recognition
+    tracker, publisher, store = outputs
+
+    if tracker:
+        for event in tracker.update(frame.objects, frame.labels, frame.confidences):
+            if publisher:
+                publisher.publish(event)
+
+    if store:
+        for i, label in enumerate(frame.labels):
+            if recognition.is_identified(label):
+                store.record(frame.name, tracker.ids[i], label, frame.confidences[i], frame.objects[i])
+
+
+def accumulate(totals, stages):
+    """
+    Adds the detector timing of the last processed frame to the running totals.
+    """
+    totals['frames'] += 1
+    for name, value in stages.items():
+        totals[name] += value
+
+
+def print_detection_timing(totals):
+    """
+    Displays the mean time and face counts per frame of the detector stages.
+    """
+    frames = max(1, totals['frames'])
+    print('Detection Timing ({} frames):'.format(totals['frames']))
+    print('  Proposal:\t{:.1f}ms ({:.1f} candidates)'.format(
+        totals['proposal'] * 1000 / frames, totals['candidates'] / frames))
+    print('  Verification:\t{:.1f}ms ({:.1f} verified)'.format(
+        totals['verification'] * 1000 / frames, totals['verified'] / frames))
+
+
+def report(recognizer, version, timing, marks):
+    """
+    Prints model reloads, and the startup timing once the first frame is shown.
+    Returns the current model version.
+    """
+    if recognizer.version != version:
+        print('Model reloaded: version {} in {:.0f}ms'.format(recognizer.version, recognizer.reload_seconds * 1000))
+
+    if timing and len(marks) < 4:
+        marks.append(('First frame', time.perf_counter()))
+        print_timing(marks)
+
+    return recognizer.version
+
+
+def run_headless(stream, chain, recognizer, video, timing, marks):
+    """
+    Captures and recognizes frames, printing the results, until interrupted
+    or the camera stops delivering frames.
+    """
+    from modules import pipeline
+    from modules import recognition
+
+    previous = None
+    version = recognizer.version
+
+    try:
+        for frame in chain.run(pipeline.camera(stream)):
+            labels = frame.labels
+
+            if labels != previous:
+                print(list(zip(labels, frame.confidences)))
+                if len(frame.skipped) > 0:
+                    print('Skipped:', [reason for box, reason in frame.skipped])
+            previous = labels
+
+            if video:
+                video.write(frame.image, any(recognition.is_identified(l) for l in labels))
+
+            version = report(recognizer, version, timing, marks)
+    except OSError as error:
+        print('Stopped: {}'.format(error))
+
+
+def run_window(stream, chain, recognizer, video, sampler, window_name, fps, timing, marks):
+    """
+    Shows the newest captured frame at the display rate, overlaid with the latest
+    results of a separate processing thread, until Esc is pressed or capturing
+    or processing fails.
+    'f' toggles recognition and 'p' toggles the profiler.
+    """
+    import cv2
+    from modules import display
+    from modules import imgproc
+    from modules import recognition
+
+    grabber = display.FrameGrabber(stream).start()
+    processor = display.Processor(grabber, lambda image: chain(image, str(stream)))
+    processor.enabled = False
+    processor.start()
+
+    cache = imgproc.TextCache()
+    version = recognizer.version
+    interval = 1.0 / fps if fps > 0 else 0.0
+    deadline = time.monotonic()
+    shown = None
+
+    try:
+        while True:
+            sequence, frame = grabber.latest()
+            result = processor.result
+            current = (sequence, result[0] if result else None)
+
+            # Only redraw when there is a new frame or new results
+            if frame is not None and current != shown:
+                shown = current
+                image = frame.copy()
+                triggered = False
+
+                if result:
+                    processed = result[2]
+                    imgproc.draw_face_info(image, processed.objects, processed.labels, processed.confidences, cache)
+                    triggered = any(recognition.is_identified(l) for l in processed.labels)
+
+                if video:
+                    video.write(image, triggered)
 
-    while True:
-        retval, frame = stream.read()
+                cv2.imshow(window_name, image)
+                version = report(recognizer, version, timing, marks)
 
-        if flags & 1:
-            objects, labels, confidences = recognizer.recognize(frame)
-            imgproc.draw_face_info(frame, objects, labels, confidences)
+            deadline = max(deadline + interval, time.monotonic())
+            key = cv2.waitKey(max(1, int((deadline - time.monotonic()) * 1000)))
 
-        cv2.imshow(window_name, frame)
-        key = cv2.waitKey(1)
+            error = grabber.error or processor.error
+            if error:
+                print('Stopped: {}'.format(error))
 
-        if key == 27:
-            cv2.destroyWindow(window_name)
-            break
-        elif key == ord('f'):
-            flags = flags ^ 1
+            if key == 27 or error:
+                cv2.destroyWindow(window_name)
+                break
+            elif key == ord('f'):
+                processor.enabled = not processor.enabled
+            elif key == ord('p'):
+                sampler.toggle()
+    finally:
+        processor.stop()
+        grabber.stop()
 
 
 if __name__ == '__main__':
@@ -27,10 +27,13 @@ import cv2
 import numpy
 
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import archive
+from modules import catalog
 from modules import configuration
+from modules import pipeline
 from modules import opt
-from modules import pathname
 from modules import recognition
+from modules import runtime
 
 
 def print_usage(message=None):
@@ -38,11 +41,12 @@ def print_usage(message=None):
     Displays program usage information.
     """
     if message: print('>>>', message, end=' <<<\n')
-    print('Usage:\t./compare_faces.py [--classifier=PATH] --label1=NAME --label2=NAME [--settings=NAME]')
+    print('Usage:\t./compare_faces.py [--classifier=PATH] --label1=NAME (--label2=NAME | --archive=PATH) [--settings=NAME]')
     print('  -h --help\t\tPrints this text')
     print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier')
     print('  -l --label1=NAME\tThe name of the person to compare FROM')
     print('  -k --label2=NAME\tThe name of the person to compare TO')
+    print('  -a --archive=PATH\tA zip/tar archive of raw images to compare TO, instead of --label2')
     print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
     print('        See \'settings/\', without \'.txt\' extension')
     exit(0)
@@ -53,12 +57,12 @@ def main():
     Main function.
     """
     label1, label2, classifier = None, None, None
-    settings = opt.map_settings()
+    source = None
     key = opt.default_settings()
 
     try:
-        short_opts = 'hc:l:k:s'
-        long_opts = ['help', 'classifier=', 'label1=', 'label2=', 'settings=']
+        short_opts = 'hc:l:k:a:s:'
+        long_opts = ['help', 'classifier=', 'label1=', 'label2=', 'archive=', 'settings=']
         opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
     except getopt.GetoptError as error:
         print_usage('Invalid argument: \"{}\"'.format(str(error)))
@@ -68,35 +72,57 @@ def main():
         elif o == '-c' or o == '--classifier':  classifier = opt.validate_file(a)
         elif o == '-l' or o == '--label1':      label1 = opt.validate_raw_dataset(a)
         elif o == '-k' or o == '--label2':      label2 = opt.validate_raw_dataset(a)
+        elif o == '-a' or o == '--archive':     source = a
         elif o == '-s' or o == '--settings':    key = a
 
     if len(opts) == 0:
         print_usage()
-    elif not label1 or not label2:
+    elif source and not opt.validate_archive(source):
+        print_usage('Archive \"{}\" not found'.format(source))
+    elif not label1 or not (label2 or source):
         print_usage('Label not specified')
-    elif key not in settings.keys():
+    elif not opt.find_settings(key):
         print_usage('Settings not specified')
 
     # Initialize variables
-    config = configuration.Config(settings[key])
+    config = configuration.Config(opt.find_settings(key))
+    manager = runtime.Runtime(config)
+    manager.apply()
     recognizer = recognition.Recognizer(classifier, label1, config)
-    raw_path = pathname.get_raw_root(label2)
+    cwidth = int(config['Camera']['width'])
     all_confidences, all_widths, all_heights = [], [], []
+    unreadable = []
     percent = 0
 
-    # Get the absolute path of each image
-    print('Collecting images of {}... '.format(label2), end='')
-    image_paths = pathname.get_raw_images(label2)
+    # Collect the images, archives are streamed member by member
+    print('Collecting images of {}... '.format(label2 or source), end='')
+    pool = manager.thread_pool(manager.workers)
+    if source:
+        frames = pipeline.from_archive(source, cwidth, pool, 2 * manager.workers)
+        l = archive.count(source)
+    else:
+        image_paths = catalog.get().raw_images(label2)
+        frames = pipeline.images(((path, path) for path in image_paths), cwidth, pool, 2 * manager.workers)
+        l = len(image_paths)
     print('DONE')
 
-    # Preprocess each image
-    for i, path in enumerate(image_paths):
-        percent = ((i+1) / len(image_paths)) * 100
-        print("\rCalculating confidence statistics... {:.1f}%".format(percent), end='')
+    # Recognize each image, decoding ahead of recognition
+    chain = pipeline.Pipeline(pipeline.Recognize.using(recognizer), config=config)
+    for i, frame in enumerate(chain.run(frames)):
+        if l:
+            percent = ((i+1) / l) * 100
+            print("\rCalculating confidence statistics... {:.1f}%".format(percent), end='')
+        else:
+            print("\rCalculating confidence statistics... ({})".format(i+1), end='')
         sys.stdout.flush()
         skip = False
 
-        image, objects, labels, confidences = recognizer.recognize_from_file(path)
+        if frame.image is None:
+            unreadable.append(frame.name)
+            print('\nUnreadable image:', frame.name)
+            continue
+
+        objects, confidences = frame.objects, frame.confidences
 
         try:
             if len(confidences) > 1:
@@ -113,7 +139,11 @@ def main():
         if skip:
             continue
 
+    pool.shutdown()
     print('\rCalculating confidence statistics... DONE  ')
+
+    if unreadable:
+        print('Unreadable images skipped: {}'.format(len(unreadable)))
     print('')
     print('Confidence Summary:')
     print('  Max:\t   {}'.format(numpy.max(all_confidences)))
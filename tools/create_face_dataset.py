@@ -22,19 +22,28 @@
 import getopt
 import os
 import sys
+import time
 
 import cv2
 
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from modules import camera
 from modules import configuration
+from modules import dataset
+from modules import dedup
 from modules import detection
+from modules import display
 from modules import imgproc
 from modules import misc
 from modules import opt
 from modules import pathname
+from modules import quality
+from modules import runtime
 
 CAMERA_DEFAULT = 0
+DEDUP_DISTANCE = 4
+BURST_RATE = 5
+BURST_LIMIT = 500
 
 
 def print_usage(message=None):
@@ -42,12 +51,17 @@ def print_usage(message=None):
     Displays program usage information.
     """
     if message: print('>>>', message, end=' <<<\n')
-    print('Usage:\t./create_face_dataset.py [--classifier=PATH] --label=NAME [--settings=NAME]')
+    print('Usage:\t./create_face_dataset.py [--classifier=PATH] --label=NAME [--settings=NAME] [--dedup] [--rate=RATE] [--max=COUNT]')
     print('  -h --help\t\tPrints this text')
     print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier (Optional)')
     print('  -l --label=NAME\tThe name of the person\'s face dataset to create')
     print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
     print('        See \'settings/\', without \'.txt\' extension')
+    print('  -d --dedup\t\tSkip photos that are near-duplicates of ones already taken')
+    print('  --distance=BITS\tMaximum hash distance of a near-duplicate (Default: {})'.format(DEDUP_DISTANCE))
+    print('  -r --rate=RATE\tPhotos per second while \'w\' is held or the timer is on (Default: {})'.format(BURST_RATE))
+    print('  -m --max=COUNT\tMaximum photos taken (Default: {})'.format(BURST_LIMIT))
+    print('  -j --threads=COUNT\tThreads preprocessing and saving photos (Default: 2)')
     exit(0)
 
 
@@ -56,12 +70,13 @@ def main():
     Main function.
     """
     classifier, label = None, None
-    settings = opt.map_settings()
+    unique, distance = False, DEDUP_DISTANCE
+    rate, limit, threads = BURST_RATE, BURST_LIMIT, 2
     key = opt.default_settings()
 
     try:
-        short_opts = 'hc:l:s:'
-        long_opts = ['help', 'classifier=', 'label=', 'settings=']
+        short_opts = 'hc:l:s:dr:m:j:'
+        long_opts = ['help', 'classifier=', 'label=', 'settings=', 'dedup', 'distance=', 'rate=', 'max=', 'threads=']
         opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
     except getopt.GetoptError as error:
         print_usage('Invalid argument: \"{}\"'.format(str(error)))
@@ -71,17 +86,23 @@ def main():
         elif o == '-c' or o == '--classifier':  classifier = opt.validate_file(a)
         elif o == '-l' or o == '--label':       label = a
         elif o == '-s' or o == '--settings':    key = a
+        elif o == '-d' or o == '--dedup':       unique = True
+        elif o == '--distance':                 distance = int(a)
+        elif o == '-r' or o == '--rate':        rate = float(a)
+        elif o == '-m' or o == '--max':         limit = int(a)
+        elif o == '-j' or o == '--threads':     threads = max(1, int(a))
 
     if len(opts) == 0:
         print_usage()
-    elif key not in settings.keys():
+    elif not opt.find_settings(key):
         print_usage('Settings file \"{}\" not found'.format(key))
 
     if not label:
         print_usage('Label not specified')
 
     # Setup training set, objects, and window
-    config = configuration.Config(settings[key])
+    config = configuration.Config(opt.find_settings(key))
+    runtime.Runtime(config).apply()
     recognizer = config['Recognizer']
     width = int(recognizer['width'])
     height = int(recognizer['height'])
@@ -95,7 +116,9 @@ def main():
     stream = camera.Camera(CAMERA_DEFAULT, config)
     print('Capture Resolution: {:d}x{:d}'.format(stream.width, stream.height))
 
-    p = 0
+    writer = dataset.DatasetWriter(label, width, height, threads, dedup.HashIndex(distance) if unique else None)
+    gate = quality.QualityGate(config)
+    status = ''
     window_name = str(stream)
     cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
     cv2.moveWindow(window_name, (dwidth - stream.width) // 2, 0)
@@ -104,35 +127,85 @@ def main():
         print('Failed to open Camera', CAMERA_DEFAULT)
         exit(1)
 
-    while True:
-        retval, frame = stream.read()
-        faces = detector.detect(frame)
-
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
-
-        cv2.putText(frame, 'Photos taken: {}'.format(p), (0, 10), cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 0))
-        cv2.putText(frame, 'Press \'w\' to take photo', (0, 22), cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 0))
-        cv2.imshow(window_name, frame)
-        key = cv2.waitKey(1)
+    # Detection runs on its own thread, the window shows the newest frame at the display rate
+    grabber = display.FrameGrabber(stream).start()
+    processor = display.Processor(grabber, detector.detect).start()
+    cache = imgproc.TextCache()
+    fps = display.get_fps(config)
+    interval = 1.0 / fps if fps > 0 else 0.0
+    deadline = time.monotonic()
+    captured, last_capture, captured_sequence = 0, 0.0, None
+    timer = False
+    shown = None
 
-        if key == 27:
+    while True:
+        sequence, frame = grabber.latest()
+        result = processor.result
+        faces = result[2] if result else []
+        current = (sequence, result[0] if result else None, captured, writer.queued, writer.written, timer, status)
+
+        # Only redraw when something changed
+        if frame is not None and current != shown:
+            shown = current
+            frame = frame.copy()
+
+            for (x, y, w, h) in faces:
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
+
+            cache.draw(frame, 'Photos taken: {}'.format(writer.written), (0, 10), (0, 255, 0))
+            cache.draw(frame, 'Press \'w\' to take photo, \'t\' for timer{}'.format(' (on)' if timer else ''), (0, 22), (0, 255, 0))
+            cache.draw(frame, 'Queued: {}'.format(writer.queued), (0, 34), (0, 255, 0))
+            if unique:
+                cache.draw(frame, 'Duplicates skipped: {}'.format(writer.duplicates), (0, 46), (0, 255, 0))
+            if status:
+                cache.draw(frame, status, (0, 58), (0, 0, 255))
+            cv2.imshow(window_name, frame)
+
+        deadline = max(deadline + interval, time.monotonic())
+        key = cv2.waitKey(max(1, int((deadline - time.monotonic()) * 1000)))
+
+        error = grabber.error or processor.error
+        if error:
+            print('Stopped: {}'.format(error))
+
+        if key == 27 or error:
+            processor.stop()
+            grabber.stop()
             cv2.destroyWindow(window_name)
             cv2.waitKey(1)
             cv2.waitKey(1)
             cv2.waitKey(1)
             cv2.waitKey(1)
+            print('Saving queued photos... ', end='')
+            sys.stdout.flush()
+            writer.close()
+            print('DONE ({} photos)'.format(writer.written))
+            if unique:
+                dedup.print_savings(writer.written, writer.duplicates)
             break
-        elif key == ord('w') and len(faces) >= 1:
-            retval, frame = stream.read()   # Get frame without drawings
+        elif key == ord('t'):
+            timer = not timer
+        elif (key == ord('w') or timer) and len(faces) >= 1:
+            # Holding 'w' (or the timer) captures at most 'rate' photos a second
+            now = time.monotonic()
+            if now - last_capture < 1.0 / rate or result[0] == captured_sequence:
+                continue
+            elif captured >= limit:
+                status = 'Photo not taken, limit of {} reached'.format(limit)
+                timer = False
+                continue
+
+            frame = result[1]   # The frame the faces were found in, without drawings
             (x, y, w, h) = faces[0]
 
-            image = imgproc.preprocess(frame, width, height, x, y, w, h)
-
-            if p < 10:  cv2.imwrite(training_path + label + '.0{}.png'.format(str(p)), image)
-            else:       cv2.imwrite(training_path + label + '.{}.png'.format(str(p)), image)
+            reason = gate.check(frame, x, y, w, h)
+            if reason:
+                status = 'Photo not taken, face is too {}'.format(reason)
+                continue
+            status = ''
 
-            p = p + 1
+            writer.submit(frame, (x, y, w, h))
+            captured, last_capture, captured_sequence = captured + 1, now, result[0]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import concurrent.futures
+import getopt
+import heapq
+import math
+import os
+import sys
+import time
+
+import cv2
+import numpy
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import catalog
+from modules import configuration
+from modules import dedup
+from modules import opt
+from modules import pathname
+from modules import pipeline
+from modules import runtime
+
+DESCRIPTOR_SIZE = 16
+DEDUP_DISTANCE = 4
+
+# Candidates each worker keeps per face wanted, the rest are never diverse enough to matter
+POOL_FACTOR = 10
+
+# The pipeline of a scanning worker process
+__CHAIN__ = {}
+
+
+def print_usage(message=None):
+    """
+    Displays program usage information.
+    """
+    if message: print('>>>', message, end=' <<<\n')
+    print('Usage:\t./enroll_from_video.py --source=PATH --label=NAME [--settings=NAME] [--count=N] [--step=N] [--jobs=N]')
+    print('  -h --help\t\tPrints this text')
+    print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier (Optional)')
+    print('  -i --source=PATH\tThe video file to enroll from')
+    print('  -l --label=NAME\tThe name of the person\'s face dataset to add to')
+    print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
+    print('                 \tSee \'settings/\', without \'.txt\' extension')
+    print('  -n --count=N\t\tNumber of faces to select (Default: 50)')
+    print('  -e --step=N\t\tOnly scan every N\'th frame (Default: 5)')
+    print('  -j --jobs=N\t\tNumber of worker processes (Default: [Runtime] workers)')
+    print('  -d --diversity=W\tWeight of diversity over quality, from 0 to 1 (Default: 0.5)')
+    print('  -p --pose-weight=W\tWeight of pose over appearance in the distance between faces (Default: 4)')
+    print('  -m --min-distance=D\tNever select faces closer than D to one already selected (Default: 0.05)')
+    print('  --distance=BITS\tMaximum hash distance of a near-duplicate of the training set (Default: {})'.format(DEDUP_DISTANCE))
+    exit(0)
+
+
+def start_scan(classifier, config):
+    """
+    Process pool initializer, builds the detection pipeline once per worker.
+    """
+    __CHAIN__['chain'] = pipeline.Pipeline(
+        pipeline.Detect(classifier, config),
+        pipeline.Preprocess(config, measure=True)
+    )
+    __CHAIN__['width'] = int(config['Camera']['width'])
+    __CHAIN__['face'] = int(config['Recognizer']['width'])
+
+
+def scan(path, start, stop, step, limit):
+    """
+    Decodes and detects faces in a range of frames of a video, keeping the best limit
+    candidates as (score, frame, box, face, appearance, pose). Returns the candidates
+    and the number of frames scanned, faces found, and faces rejected.
+    """
+    chain, width = __CHAIN__['chain'], __CHAIN__['width']
+    heap = []
+    frames, faces, rejected = 0, 0, 0
+
+    for frame in chain.run(pipeline.video(path, width, start, stop, step)):
+        frames = frames + 1
+
+        for i, (box, face) in enumerate(zip(frame.objects, frame.faces)):
+            faces = faces + 1
+            if face is None:
+                rejected = rejected + 1
+                continue
+
+            value = score(frame.quality[i], box, __CHAIN__['face'])
+            appearance, pose = describe(face)
+            entry = (value, frame.sequence, i, (value, frame.sequence, tuple(box), face, appearance, pose))
+
+            # Sequence and index are unique, so faces are never compared
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif value > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+
+    return ([entry[3] for entry in heap], frames, faces, rejected)
+
+
+def score(measured, box, size):
+    """
+    Rates a face for training from its imgproc.measure_quality(): sharp, well exposed,
+    contrasty, and at least as large as the faces the recognizer is trained on.
+    """
+    (x, y, w, h) = box
+    sharpness, brightness, contrast = measured
+    exposure = max(0.0, 1.0 - abs(brightness - 128) / 128)
+    return math.log1p(sharpness) * min(1.0, contrast / 64) * exposure * min(1.0, w / size)
+
+
+def describe(face):
+    """
+    Returns the appearance (unit vector of the downsampled, zero mean face) and the pose
+    (offset of the centre of its edges from the middle, in [-1, 1]) of a preprocessed face.
+    """
+    small = cv2.resize(face, (DESCRIPTOR_SIZE, DESCRIPTOR_SIZE), interpolation=cv2.INTER_AREA)
+    small = small.astype(numpy.float32).ravel()
+    small = small - small.mean()
+    appearance = small / (numpy.linalg.norm(small) or 1.0)
+
+    # A turned or tilted face moves its features, and their edges, off centre
+    edges = cv2.magnitude(cv2.Sobel(face, cv2.CV_32F, 1, 0), cv2.Sobel(face, cv2.CV_32F, 0, 1))
+    total = float(edges.sum()) or 1.0
+    (h, w) = face.shape
+    yaw = float((edges.sum(axis=0) * numpy.linspace(-1, 1, w)).sum()) / total
+    pitch = float((edges.sum(axis=1) * numpy.linspace(-1, 1, h)).sum()) / total
+    return (appearance, numpy.array([yaw, pitch], numpy.float32))
+
+
+def select(candidates, count, diversity, pose_weight, minimum):
+    """
+    Greedily picks count candidates, each time the one with the best mix of its own
+    quality and its distance to the nearest face already picked.
+    """
+    if len(candidates) == 0:
+        return []
+
+    scores = numpy.array([c[0] for c in candidates])
+    scores = scores / (scores.max() or 1.0)
+    appearances = numpy.stack([c[4] for c in candidates])
+    poses = numpy.stack([c[5] for c in candidates])
+    nearest = numpy.full(len(candidates), numpy.inf)
+    available = numpy.ones(len(candidates), bool)
+    chosen = []
+
+    while len(chosen) < count and available.any():
+        if chosen:
+            spread = nearest[available].max() or 1.0
+            value = (1 - diversity) * scores + diversity * numpy.minimum(nearest, spread) / spread
+        else:
+            value = scores.copy()
+
+        value[~available] = -numpy.inf
+        best = int(value.argmax())
+        chosen.append(candidates[best])
+        available[best] = False
+
+        distances = (1.0 - appearances @ appearances[best]) + pose_weight * numpy.linalg.norm(poses - poses[best], axis=1)
+        nearest = numpy.minimum(nearest, distances)
+        available &= nearest >= minimum
+
+    return chosen
+
+
+def index_training_set(label, distance):
+    """
+    Hashes the faces already in the label's training set.
+    """
+    index = dedup.HashIndex(distance)
+
+    for path in catalog.get().training_images(label):
+        face = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if face is not None:
+            index.add(dedup.dhash(face), path)
+
+    return index
+
+
+def next_number(label):
+    """
+    The number after the highest one in the label's training set.
+    """
+    numbers = [-1]
+
+    for path in catalog.get().training_images(label):
+        try:
+            numbers.append(int(os.path.basename(path).split('.')[-2]))
+        except (IndexError, ValueError) as error:
+            continue
+
+    return max(numbers) + 1
+
+
+def main():
+    """
+    Main function.
+    """
+    classifier, label, source = None, None, None
+    count, step, jobs = 50, 5, None
+    diversity, pose_weight, minimum = 0.5, 4.0, 0.05
+    distance = DEDUP_DISTANCE
+    key = opt.default_settings()
+
+    try:
+        short_opts = 'hc:i:l:s:n:e:j:d:p:m:'
+        long_opts = ['help', 'classifier=', 'source=', 'label=', 'settings=', 'count=', 'step=', 'jobs=',
+                     'diversity=', 'pose-weight=', 'min-distance=', 'distance=']
+        opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+    except getopt.GetoptError as error:
+        print_usage('Invalid argument: \"{}\"'.format(str(error)))
+
+    for o, a in opts:
+        if o == '-h' or o == '--help':          print_usage()
+        elif o == '-c' or o == '--classifier':  classifier = opt.validate_file(a)
+        elif o == '-i' or o == '--source':      source = opt.validate_file(a)
+        elif o == '-l' or o == '--label':       label = a
+        elif o == '-s' or o == '--settings':    key = a
+        elif o == '-n' or o == '--count':       count = int(a)
+        elif o == '-e' or o == '--step':        step = max(1, int(a))
+        elif o == '-j' or o == '--jobs':        jobs = int(a)
+        elif o == '-d' or o == '--diversity':   diversity = float(a)
+        elif o == '-p' or o == '--pose-weight': pose_weight = float(a)
+        elif o == '-m' or o == '--min-distance': minimum = float(a)
+        elif o == '--distance':                 distance = int(a)
+
+    if len(opts) == 0:
+        print_usage()
+    elif not opt.find_settings(key):
+        print_usage('Settings file \"{}\" not found'.format(key))
+    elif not source:
+        print_usage('Source not specified')
+    elif not label:
+        print_usage('Label not specified')
+
+    # Initialize variables
+    config = configuration.Config(opt.find_settings(key))
+    manager = runtime.Runtime(config)
+    jobs = jobs or manager.workers
+    capture = cv2.VideoCapture(source)
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    capture.release()
+
+    if total <= 0:
+        print('Failed to open', source)
+        exit(1)
+
+    # Split the video into step aligned ranges, a few per worker to even out the load
+    chunks = max(1, min(jobs * 4, total // (step * 10) or 1))
+    size = int(math.ceil(total / chunks / step)) * step
+    ranges = [(s, min(total, s + size)) for s in range(0, total, size)]
+    candidates, frames, faces, rejected = [], 0, 0, 0
+    start = time.perf_counter()
+
+    with manager.process_pool(jobs, start_scan, (classifier, config)) as executor:
+        futures = [executor.submit(scan, source, a, b, step, count * POOL_FACTOR) for (a, b) in ranges]
+
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            found, f, n, r = future.result()
+            candidates.extend(found)
+            frames, faces, rejected = frames + f, faces + n, rejected + r
+            print('\rScanning video... ({}/{})'.format(i+1, len(ranges)), end='')
+            sys.stdout.flush()
+
+    print('\rScanning video... DONE      ')
+    scanned = time.perf_counter() - start
+
+    # Pick the best diverse faces and add them to the training set
+    print('Selecting faces... ', end='')
+    # Faces the training set already has add nothing
+    index = index_training_set(label, distance)
+    fresh = [c for c in candidates if index.find(dedup.dhash(c[3])) is None]
+    duplicates = len(candidates) - len(fresh)
+    chosen = []
+
+    for candidate in select(fresh, count, diversity, pose_weight, minimum):
+        if index.add_unique(dedup.dhash(candidate[3]), candidate[1]) is None:
+            chosen.append(candidate)
+        else:
+            duplicates = duplicates + 1
+    print('DONE')
+
+    os.makedirs(pathname.get_training_root(label), exist_ok=True)
+    number = next_number(label)
+    for i, candidate in enumerate(sorted(chosen, key=lambda c: c[1])):
+        cv2.imwrite(pathname.get_training_file(label, number + i), candidate[3])
+
+    elapsed = time.perf_counter() - start
+    duration = total / fps
+    print('')
+    print('Enrollment Summary:')
+    print('  Video:    {:.1f}s, {} frames scanned'.format(duration, frames))
+    print('  Faces:    {} found, {} rejected, {} candidates'.format(faces, rejected, len(candidates)))
+    print('  Selected: {} ({} near-duplicates of the training set or each other skipped)'.format(len(chosen), duplicates))
+    print('  Scanning: {:.2f}s ({} jobs)'.format(scanned, jobs))
+    print('  Elapsed:  {:.2f}s ({:.1f}x real time)'.format(elapsed, duration / elapsed if elapsed else 0.0))
+    print('  Output:   {}'.format(pathname.get_training_root(label)))
+
+
+if __name__ == '__main__':
+    """
+    Program entry.
+    """
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        exit(0)
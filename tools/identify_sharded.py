@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import getopt
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import catalog
+from modules import configuration
+from modules import imgproc
+from modules import opt
+from modules import runtime
+from modules import shards
+
+
+def print_usage(message=None):
+    """
+    Displays program usage information.
+    """
+    if message: print('>>>', message, end=' <<<\n')
+    print('Usage:\t./identify_sharded.py --serve=HOST:PORT --shard=I/N [--settings=NAME]')
+    print('      \t./identify_sharded.py (--shards=HOST:PORT,... | --local=N) [--classifier=PATH] [--settings=NAME] --file=PATH ...')
+    print('  -h --help\t\tPrints this text')
+    print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier (Optional)')
+    print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
+    print('                 \tSee \'settings/\', without \'.txt\' extension')
+    print('  -w --serve=HOST:PORT\tRun a worker answering for one shard of the recognizers')
+    print('  -n --shard=I/N\tThe shard to serve, I counts from 0')
+    print('  -a --shards=LIST\tComma separated addresses of the workers of every shard, in order')
+    print('  -L --local=N\t\tStart N workers on this host instead (for testing)')
+    print('  -f --file=PATH\tA still image to identify the faces in, may be repeated')
+    exit(0)
+
+
+def serve(address, shard, count, config):
+    """
+    Serves one shard until interrupted.
+    """
+    labels = shards.partition(catalog.get().recognizer_labels(), count)[shard]
+    start = time.perf_counter()
+    worker = shards.Worker(labels, config, address, shard)
+    print('Shard {}/{}: {} labels loaded in {:.2f}s, listening on {}'.format(
+        shard, count, len(labels), time.perf_counter() - start, worker.address))
+
+    try:
+        worker.serve_forever()
+    finally:
+        worker.close()
+
+
+def identify(coordinator, paths, width):
+    """
+    Identifies the faces in each image, printing the matches and any shards that did not answer.
+    """
+    for path in paths:
+        image = imgproc.read_image(path, width)
+        start = time.perf_counter()
+        objects, labels, confidences, missing = coordinator.recognize(image)
+        elapsed = time.perf_counter() - start
+
+        print('{} ({:.1f}ms):'.format(path, elapsed * 1000))
+        if len(objects) == 0:
+            print('  No faces detected')
+        for (x, y, w, h), label, confidence in zip(objects, labels, confidences):
+            print('  {} {}'.format((label, confidence), '{:d}x{:d}+{:d}+{:d}'.format(w, h, x, y)))
+        if len(missing) > 0:
+            print('  Partial result, no answer from: {}'.format(', '.join(missing)))
+
+
+def main():
+    """
+    Main function.
+    """
+    classifier, address, shard, addresses = None, None, None, None
+    local = 0
+    paths = []
+    key = opt.default_settings()
+
+    try:
+        short_opts = 'hc:s:w:n:a:L:f:'
+        long_opts = ['help', 'classifier=', 'settings=', 'serve=', 'shard=', 'shards=', 'local=', 'file=']
+        opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+    except getopt.GetoptError as error:
+        print_usage('Invalid argument: \"{}\"'.format(str(error)))
+
+    for o, a in opts:
+        if o == '-h' or o == '--help':          print_usage()
+        elif o == '-c' or o == '--classifier':  classifier = opt.validate_file(a)
+        elif o == '-s' or o == '--settings':    key = a
+        elif o == '-w' or o == '--serve':       address = a
+        elif o == '-n' or o == '--shard':       shard = a
+        elif o == '-a' or o == '--shards':      addresses = [s.strip() for s in a.split(',') if s.strip()]
+        elif o == '-L' or o == '--local':       local = int(a)
+        elif o == '-f' or o == '--file':        paths.append(opt.validate_file(a))
+
+    if len(opts) == 0:
+        print_usage()
+    elif not opt.find_settings(key):
+        print_usage('Settings file \"{}\" not found'.format(key))
+
+    config = configuration.Config(opt.find_settings(key))
+    runtime.Runtime(config).apply()
+
+    if address:
+        try:
+            index, count = map(int, (shard or '').split('/'))
+        except ValueError as ve:
+            print_usage('Shard not specified')
+        if not 0 <= index < count:
+            print_usage('Invalid shard \"{}\"'.format(shard))
+        serve(address, index, count, config)
+        return
+
+    if not addresses and local <= 0:
+        print_usage('Shards not specified')
+    elif len(paths) == 0 or None in paths:
+        print_usage('File not specified')
+
+    processes = []
+    labels = catalog.get().recognizer_labels()
+    if not addresses:
+        print('Starting {} local workers... '.format(local), end='')
+        sys.stdout.flush()
+        try:
+            processes, addresses = shards.start_local(shards.partition(labels, local), config)
+        except (RuntimeError, TimeoutError) as error:
+            print('FAILED')
+            print(error)
+            exit(1)
+        print('DONE')
+
+    coordinator = shards.Coordinator(addresses, classifier, config)
+
+    try:
+        # Every label must be served exactly once, or matches go missing or are counted twice
+        try:
+            print('Serving {} labels from {} shards'.format(coordinator.check(labels), len(addresses)))
+        except (OSError, ValueError) as error:
+            print('Shards are inconsistent: {}'.format(error))
+            exit(1)
+        identify(coordinator, paths, int(config['Camera']['width']))
+    finally:
+        coordinator.close()
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    """
+    Program entry.
+    """
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        exit(0)
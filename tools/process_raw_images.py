@@ -23,17 +23,21 @@ import getopt
 import os
 import sys
 
-import numpy
-from PIL import Image
 import cv2
 
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from modules import camera
+from modules import archive
+from modules import catalog
 from modules import configuration
-from modules import detection
+from modules import dedup
 from modules import imgproc
 from modules import opt
+from modules import pipeline
 from modules import pathname
+from modules import quality
+from modules import runtime
+
+DEDUP_DISTANCE = 4
 
 
 def print_usage(message=None):
@@ -41,13 +45,17 @@ def print_usage(message=None):
     Displays program usage information.
     """
     if message: print('>>>', message, end=' <<<\n')
-    print('Usage:\t./process_raw_images.py [--classifier=PATH] --label=NAME [--settings=NAME] [--show]')
+    print('Usage:\t./process_raw_images.py [--classifier=PATH] --label=NAME [--archive=PATH] [--settings=NAME] [--show] [--dedup=MODE]')
     print('  -h --help\tPrints this text')
     print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier (Optional)')
     print('  -l --label=NAME\tThe name of the person\'s face dataset to create')
+    print('  -a --archive=PATH\tRead raw images from a zip/tar archive instead of \'data/raw/NAME/\'')
     print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
     print('        See \'settings/\', without \'.txt\' extension')
     print('  -w --show\t\tOpens a window to show images being processed')
+    print('  -d --dedup=MODE\tDetect near-duplicate faces, MODE is \'flag\' or \'drop\'')
+    print('  --distance=BITS\tMaximum hash distance of a near-duplicate (Default: {})'.format(DEDUP_DISTANCE))
+    print('  -j --threads=N\tNumber of image decoding threads (Default: [Runtime] workers)')
     exit(0)
 
 
@@ -55,14 +63,15 @@ def main():
     """
     Main function.
     """
-    classifier, label = None, None
+    classifier, label, source = None, None, None
+    threads = None
     show = False
-    settings = opt.map_settings()
+    mode, distance = None, DEDUP_DISTANCE
     key = opt.default_settings()
 
     try:
-        short_opts = 'hc:l:s:w'
-        long_opts = ['help', 'classifier=', 'label=', 'settings=', 'show']
+        short_opts = 'hc:l:a:s:wd:j:'
+        long_opts = ['help', 'classifier=', 'label=', 'archive=', 'settings=', 'show', 'dedup=', 'distance=', 'threads=']
         opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
     except getopt.GetoptError as error:
         print_usage('Invalid argument: \"{}\"'.format(str(error)))
@@ -70,47 +79,75 @@ def main():
     for o, a in opts:
         if o == '-h' or o == '--help':          print_usage()
         elif o == '-c' or o == '--classifier':  classifier = opt.validate_file(a)
-        elif o == '-l' or o == '--label':       label = opt.validate_raw_dataset(a)
+        elif o == '-l' or o == '--label':       label = a
+        elif o == '-a' or o == '--archive':     source = a
         elif o == '-s' or o == '--settings':    key = a
         elif o == '-w' or o == '--show':        show = True
+        elif o == '-d' or o == '--dedup':       mode = a
+        elif o == '--distance':                 distance = int(a)
+        elif o == '-j' or o == '--threads':     threads = int(a)
 
     if len(opts) == 0:
         print_usage()
-    elif key not in settings.keys():
+    elif not opt.find_settings(key):
         print_usage('Settings file \"{}\" not found'.format(key))
 
+    if source and not opt.validate_archive(source):
+        print_usage('Archive \"{}\" not found'.format(source))
+    elif not source and label:
+        label = opt.validate_raw_dataset(label)
+
     if not label:
         print_usage('Label not specified')
+    elif mode not in [None, 'flag', 'drop']:
+        print_usage('Invalid dedup mode \"{}\"'.format(mode))
 
     # Initialize variables
-    config = configuration.Config(settings[key])
+    config = configuration.Config(opt.find_settings(key))
+    manager = runtime.Runtime(config)
+    manager.apply()
+    threads = threads or manager.workers
     recognizer = config['Recognizer']
     width = int(recognizer['width'])
     height = int(recognizer['height'])
-    stream = camera.Camera(0, config)
-    detector = detection.Detector(classifier, config)
-    raw_path = pathname.get_raw_root(label)
+    cwidth = int(config['Camera']['width'])
     training_path = pathname.get_training_root(label)
     os.makedirs(training_path, exist_ok=True)
+    index = dedup.HashIndex(distance)
+    gate = quality.QualityGate(config)
+    rejected, unreadable = 0, []
+    kept, duplicates = 0, 0
 
-    # Get the absolute path of each image
+    # Collect the raw images, archives are streamed member by member
     print('Collecting raw images... ', end='')
-    image_paths = pathname.get_raw_images(label)
+    pool = manager.thread_pool(threads)
+    if source:
+        frames = pipeline.from_archive(source, cwidth, pool, 2 * threads)
+        l = archive.count(source) or '?'
+    else:
+        image_paths = catalog.get().raw_images(label)
+        frames = pipeline.images(((path, path) for path in image_paths), cwidth, pool, 2 * threads)
+        l = len(image_paths)
     print('DONE')
 
+    # Decoding and detection run ahead on their own threads
+    execution = pipeline.THREAD if threads > 1 else pipeline.INLINE
+    chain = pipeline.Pipeline(pipeline.Detect(classifier, config, execution, threads), config=config)
+
     # Preprocess each image
-    l = len(image_paths)
-    for i, path in enumerate(image_paths):
+    for i, frame in enumerate(chain.run(frames)):
         print('\rPreprocessing raw images... ({}/{})'.format(str(i+1), str(l)), end='')
+        path, image = frame.name, frame.image
         cont = False
-        image_pil = Image.open(path)
-        image_org = numpy.array(image_pil)
-        image_rgb = cv2.cvtColor(image_org, cv2.COLOR_BGR2RGB)
-        image = cv2.resize(image_rgb, (stream.width, int(stream.width / (image_pil.size[0] / image_pil.size[1]))))
         (x, y, w, h) = (0, 0, 0, 0)
 
+        if image is None:
+            unreadable.append(path)
+            print('\nUnreadable image:', path)
+            continue
+
         try:
-            (x, y, w, h) = detector.detect(image)[0]
+            (x, y, w, h) = frame.objects[0]
         except IndexError:
             print('\nNo faces detected in:', path)
             cont = True
@@ -123,13 +160,41 @@ def main():
         if cont:
             continue
 
+        reason = gate.check(image, x, y, w, h)
+        if reason:
+            rejected = rejected + 1
+            print('\nLow quality ({}) face in:'.format(reason), path)
+            continue
+
         face = imgproc.preprocess(image, width, height, x, y, w, h)
 
-        if i < 10:  cv2.imwrite(training_path + label + '.0{}.png'.format(str(i)), face)
-        else:       cv2.imwrite(training_path + label + '.{}.png'.format(str(i)), face)
+        if mode:
+            original = index.add_unique(dedup.dhash(face), path)
+            if original:
+                duplicates = duplicates + 1
+                print('\nNear-duplicate of {}: {}'.format(os.path.basename(original), path))
+                if mode == 'drop':
+                    continue
+            kept = kept + 1
+
+        cv2.imwrite(pathname.get_training_file(label, i), face)
 
+    pool.shutdown()
     print('\rPreprocessing raw images... DONE    ')
 
+    if unreadable:
+        print('Unreadable images skipped: {}'.format(len(unreadable)))
+
+    if gate.enabled:
+        print('Low quality faces skipped: {}'.format(rejected))
+
+    if mode:
+        print('')
+        if mode == 'drop':
+            dedup.print_savings(kept, duplicates)
+        else:
+            print('Near-duplicates flagged: {} of {}'.format(duplicates, kept))
+
 
 if __name__ == '__main__':
     """
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import getopt
+import os
+import sqlite3
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import pathname
+from modules import sightings
+
+
+def print_usage(message=None):
+    """
+    Displays program usage information.
+    """
+    if message: print('>>>', message, end=' <<<\n')
+    print('Usage:\t./query_sightings.py [--database=PATH] --last=NAME | --counts [--since=HOURS]')
+    print('  -h --help\t\tPrints this text')
+    print('  -d --database=PATH\tSightings database (Default: data/sightings.db)')
+    print('  -l --last=NAME\tWhen and where the person was last seen')
+    print('  -c --counts\t\tNumber of sightings and time seen for each person')
+    print('  -s --since=HOURS\tOnly count sightings from the last HOURS')
+    exit(0)
+
+
+def format_time(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds))
+
+
+def main():
+    """
+    Main function.
+    """
+    database = pathname.get_sightings_file()
+    last, since = None, None
+    show_counts = False
+
+    try:
+        short_opts = 'hd:l:cs:'
+        long_opts = ['help', 'database=', 'last=', 'counts', 'since=']
+        opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+    except getopt.GetoptError as error:
+        print_usage('Invalid argument: \"{}\"'.format(str(error)))
+
+    for o, a in opts:
+        if o == '-h' or o == '--help':          print_usage()
+        elif o == '-d' or o == '--database':    database = a
+        elif o == '-l' or o == '--last':        last = a
+        elif o == '-c' or o == '--counts':      show_counts = True
+        elif o == '-s' or o == '--since':       since = time.time() - float(a) * 3600
+
+    if len(opts) == 0:
+        print_usage()
+    elif not os.path.isfile(database):
+        print_usage('Database \"{}\" not found'.format(database))
+    elif not last and not show_counts:
+        print_usage('Nothing to query')
+
+    # Read-only, a query must never create the schema or change the journal mode
+    db = sqlite3.connect('file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(database))), uri=True)
+
+    try:
+        if last:
+            row = sightings.last_seen(db, last)
+            if row:
+                start, end, camera = row
+                print('{} last seen by {} at {} (for {:.0f}s)'.format(last, camera, format_time(end), end - start))
+            else:
+                print('{} has never been seen'.format(last))
+
+        if show_counts:
+            print('  Label\t\tSightings  Seconds   Last Seen')
+            for label, count, seconds, seen in sightings.counts(db, since):
+                print('  {:<14}{:<10} {:<9.0f} {}'.format(label, count, seconds, format_time(seen)))
+    except sqlite3.DatabaseError as error:
+        print_usage('Cannot query \"{}\": {}'.format(database, error))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    """
+    Program entry.
+    """
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        exit(0)
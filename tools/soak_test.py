@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import getopt
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import camera
+from modules import configuration
+from modules import opt
+from modules import pipeline
+from modules import recognition
+from modules import runtime
+
+
+def print_usage(message=None):
+    """
+    Displays program usage information.
+    """
+    if message: print('>>>', message, end=' <<<\n')
+    print('Usage:\t./soak_test.py --source=PATH --label=NAME [--settings=NAME] [--duration=HOURS] [--output=PATH]')
+    print('  -h --help\t\tPrints this text')
+    print('  -c --classifier=PATH\tThe absolute path of a Face Detection classifier (Optional)')
+    print('  -i --source=PATH\tDirectory of images or a video file to replay as a camera')
+    print('  -l --label=NAME\tThe name of the person\'s face to recognize')
+    print('  -s --settings=NAME\tThe name of a file located under \'settings/\'')
+    print('                 \tSee \'settings/\', without \'.txt\' extension')
+    print('  -f --fps=FPS\t\tFrame rate of the virtual camera (Default: 15)')
+    print('  -d --duration=HOURS\tHow long to run for (Default: 1)')
+    print('  -p --interval=SECONDS\tTime between samples (Default: 60)')
+    print('  -o --output=PATH\tCSV file of the samples (Default: soak.csv)')
+    print('  -m --max-rss=MIB\tFail if RSS grows faster than MIB per hour (Default: 8)')
+    print('  -t --max-latency=MS\tFail if frame latency grows faster than MS per hour (Default: 5)')
+    print('  -n --top=COUNT\tNumber of top allocators to report (Default: 10)')
+    exit(0)
+
+
+def get_rss():
+    """
+    Returns the resident set size of this process in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError as ose:
+        # Peak, not current, but better than nothing off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def slope(xs, ys):
+    """
+    Least squares slope of ys over xs.
+    """
+    n = len(xs)
+    if n < 2:
+        return 0.0
+    mx, my = sum(xs) / n, sum(ys) / n
+    var = sum((x - mx) ** 2 for x in xs)
+    if var == 0:
+        return 0.0
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var
+
+
+def main():
+    """
+    Main function.
+    """
+    classifier, label, source = None, None, None
+    fps, duration, interval, top = 15.0, 1.0, 60.0, 10
+    max_rss, max_latency = 8.0, 5.0
+    output = 'soak.csv'
+    key = opt.default_settings()
+
+    try:
+        short_opts = 'hc:i:l:s:f:d:p:o:m:t:n:'
+        long_opts = ['help', 'classifier=', 'source=', 'label=', 'settings=', 'fps=', 'duration=',
+                     'interval=', 'output=', 'max-rss=', 'max-latency=', 'top=']
+        opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+    except getopt.GetoptError as error:
+        print_usage('Invalid argument: \"{}\"'.format(str(error)))
+
+    for o, a in opts:
+        if o == '-h' or o == '--help':          print_usage()
+        elif o == '-c' or o == '--classifier':  classifier = opt.validate_file(a)
+        elif o == '-i' or o == '--source':      source = a if os.path.exists(a) else None
+        elif o == '-l' or o == '--label':       label = opt.validate_recognizer(a)
+        elif o == '-s' or o == '--settings':    key = a
+        elif o == '-f' or o == '--fps':         fps = float(a)
+        elif o == '-d' or o == '--duration':    duration = float(a)
+        elif o == '-p' or o == '--interval':    interval = float(a)
+        elif o == '-o' or o == '--output':      output = a
+        elif o == '-m' or o == '--max-rss':     max_rss = float(a)
+        elif o == '-t' or o == '--max-latency': max_latency = float(a)
+        elif o == '-n' or o == '--top':         top = int(a)
+
+    if len(opts) == 0:
+        print_usage()
+    elif not opt.find_settings(key):
+        print_usage('Settings file \"{}\" not found'.format(key))
+    elif not source:
+        print_usage('Source not specified')
+    elif not label:
+        print_usage('Label not specified')
+
+    # Initialize variables
+    config = configuration.Config(opt.find_settings(key))
+    runtime.Runtime(config).apply()
+    stream = camera.VirtualCamera(source, config, fps)
+    recognizer = recognition.Recognizer(classifier, label, config)
+    chain = pipeline.Pipeline(pipeline.Recognize.using(recognizer), pipeline.Draw(), config=config)
+    hours, rss, latency = [], [], []
+
+    if not stream.open():
+        print('Failed to open', source)
+        exit(1)
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    start = time.monotonic()
+    end = start + duration * 3600
+    sample = start + interval
+    frames, elapsed = 0, 0.0
+
+    print('Soaking {} for {:.2f} hours, sampling every {:.0f}s'.format(stream, duration, interval))
+
+    with open(output, 'w') as csv:
+        csv.write('seconds,frames,rss_bytes,traced_bytes,latency_ms\n')
+
+        for frame in chain.run(pipeline.camera(stream)):
+            elapsed = elapsed + sum(frame.timing.values())
+            frames = frames + 1
+
+            now = time.monotonic()
+            if now >= end:
+                break
+            if now >= sample:
+                traced, peak = tracemalloc.get_traced_memory()
+                hours.append((now - start) / 3600)
+                rss.append(get_rss() / 2**20)
+                latency.append((elapsed / frames) * 1000 if frames else 0.0)
+                csv.write('{:.1f},{},{},{},{:.3f}\n'.format(
+                    now - start, frames, int(rss[-1] * 2**20), traced, latency[-1]))
+                csv.flush()
+                print('\r{:.0f}s: RSS {:.1f} MiB, latency {:.1f}ms'.format(now - start, rss[-1], latency[-1]), end='')
+                sys.stdout.flush()
+                sample = now + interval
+                frames, elapsed = 0, 0.0
+
+    stream.release()
+    print('')
+
+    # Report
+    rss_slope = slope(hours, rss)
+    latency_slope = slope(hours, latency)
+    stats = tracemalloc.take_snapshot().compare_to(baseline, 'lineno')
+    tracemalloc.stop()
+
+    print('')
+    print('Top Allocators:')
+    for stat in stats[:top]:
+        print('  {}'.format(stat))
+    print('')
+    print('Soak Summary:')
+    print('  Samples:  {}'.format(len(hours)))
+    print('  RSS:\t    {:+.2f} MiB/hour (limit {:.2f})'.format(rss_slope, max_rss))
+    print('  Latency:  {:+.2f} ms/hour (limit {:.2f})'.format(latency_slope, max_latency))
+    print('  Output:   {}'.format(output))
+
+    if rss_slope > max_rss or latency_slope > max_latency:
+        print('FAILED')
+        exit(1)
+    print('PASSED')
+
+
+if __name__ == '__main__':
+    """
+    Program entry.
+    """
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        exit(0)
@@ -19,18 +19,24 @@
 # If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
 #######################################################################
 
+import concurrent.futures
 import getopt
 import os
 import sys
+import tempfile
+import time
 
 import numpy
 from PIL import Image
 import cv2
 
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import catalog
+from modules import configuration
 from modules import opt
 from modules import pathname
 from modules import recognition
+from modules import runtime
 
 
 def print_usage(message=None):
@@ -38,21 +44,118 @@ def print_usage(message=None):
     Displays program usage information.
     """
     if message: print('>>>', message, end=' <<<\n')
-    print('Usage:\t./train_facerecognizer.py -l NAME')
+    print('Usage:\t./train_facerecognizer.py -l NAME | -a | -L NAME,NAME,... [-j JOBS] [-t THREADS] [-s NAME]')
     print('  -h --help\t\tPrints this text')
     print('  -l --label=NAME\tThe name of the person\'s face to recognize')
+    print('  -a --all\t\tTrains a recognizer for every label with a training set')
+    print('  -L --labels=NAMES\tComma separated list of labels to train')
+    print('  -j --jobs=JOBS\tNumber of labels trained in parallel (Default: core count)')
+    print('  -t --threads=THREADS\tNumber of image loading threads per label (Default: 4)')
+    print('  -s --settings=NAME\tThe name of a file located under \'settings/\', for its [Runtime] (Optional)')
+    print('                 \tSee \'settings/\', without \'.txt\' extension')
     exit(0)
 
 
+def load_image(path):
+    """
+    Reads a training image into a grayscale array.
+    """
+    image_pil = Image.open(path)
+    image = numpy.array(image_pil)
+    (w, h) = image_pil.size
+    return image[0: h, 0: w]
+
+
+def train(label, threads=1):
+    """
+    Trains and saves the recognizer for a single label.
+    Returns the label, number of images, and seconds taken.
+    """
+    start = time.perf_counter()
+    recognizer_path = pathname.get_recognizer_file(label)
+    recognizer = cv2.face.createLBPHFaceRecognizer()
+    image_paths = catalog.get().training_images(label)
+
+    # Decoding is done by Pillow/Numpy which release the GIL
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        images = list(executor.map(load_image, image_paths))
+
+    labels = [recognition.hash_label(label)] * len(images)
+    recognizer.train(images, numpy.array(labels))
+
+    # Replace the model in one step, so a watching Recognizer never reads half of it
+    os.makedirs(pathname.get_recognizer_root(), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix='.', suffix='.xml', dir=pathname.get_recognizer_root())
+    os.close(fd)
+    try:
+        recognizer.save(temporary)
+        # mkstemp files are owner-only, a Recognizer may run as another user
+        os.chmod(temporary, file_mode(recognizer_path))
+        os.replace(temporary, recognizer_path)
+    except BaseException as error:
+        os.remove(temporary)
+        raise
+
+    return (label, len(images), time.perf_counter() - start)
+
+
+def file_mode(path):
+    """
+    The permissions of an existing file, or those a new file gets under the umask.
+    """
+    try:
+        return os.stat(path).st_mode & 0o777
+    except OSError as ose:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def train_all(manager, labels, jobs, threads):
+    """
+    Trains the recognizers for several labels in parallel processes.
+    """
+    results, failures = [], []
+    start = time.perf_counter()
+
+    with manager.process_pool(jobs) as executor:
+        futures = {executor.submit(train, label, threads): label for label in labels}
+
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            label = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as error:
+                failures.append((label, error))
+            print('\rTraining recognizers... ({}/{})'.format(i+1, len(labels)), end='')
+            sys.stdout.flush()
+
+    elapsed = time.perf_counter() - start
+    print('\rTraining recognizers... DONE      ')
+    print('')
+    print('Training Summary:')
+    for label, count, seconds in sorted(results):
+        print('  {}:\t{} images in {:.2f}s'.format(label, count, seconds))
+    for label, error in sorted(failures, key=lambda f: f[0]):
+        print('  {}:\tFAILED ({})'.format(label, error))
+    print('')
+    print('  Labels:   {}'.format(len(results)))
+    print('  Images:   {}'.format(sum(r[1] for r in results)))
+    print('  Work:     {:.2f}s'.format(sum(r[2] for r in results)))
+    print('  Elapsed:  {:.2f}s ({} jobs)'.format(elapsed, jobs))
+
+
 def main():
     """
     Main function.
     """
-    label = None
+    label, labels = None, None
+    jobs, threads = None, 4
+    key = None
 
     try:
-        short_opts = 'hl:'
-        long_opts = ['help', 'label=']
+        short_opts = 'hl:aL:j:t:s:'
+        long_opts = ['help', 'label=', 'all', 'labels=', 'jobs=', 'threads=', 'settings=']
         opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
     except getopt.GetoptError as error:
         print_usage('Invalid argument: \"{}\"'.format(str(error)))
@@ -60,44 +163,37 @@ def main():
     for o, a in opts:
         if o == '-h' or o == '--help':      print_usage()
         elif o == '-l' or o == '--label':   label = opt.validate_training_dataset(a)
+        elif o == '-a' or o == '--all':     labels = catalog.get().training_labels()
+        elif o == '-L' or o == '--labels':  labels = [l for l in a.split(',') if opt.validate_training_dataset(l)]
+        elif o == '-j' or o == '--jobs':    jobs = max(1, int(a))
+        elif o == '-t' or o == '--threads': threads = max(1, int(a))
+        elif o == '-s' or o == '--settings': key = a
 
     if len(opts) == 0:
         print_usage()
 
+    # Settings only tune the CPU split, training works without them
+    settings = opt.find_settings(key or opt.default_settings())
+    if key and not settings:
+        print('Settings file \"{}\" not found, using the default CPU split'.format(key))
+
+    manager = runtime.Runtime(configuration.Config(settings) if settings else None).apply()
+    jobs = jobs or manager.cores
+
+    if labels is not None:
+        if len(labels) == 0:
+            print_usage('No training sets found!')
+        train_all(manager, labels, min(jobs, len(labels)), threads)
+        return
+
     if not label:
         print_usage('Label not specified!')
 
-    # Initialize variables
-    recognizer_path = pathname.get_recognizer_file(label)
-    recognizer = cv2.face.createLBPHFaceRecognizer()
-    filename = label + '.lbph.xml'
-    images = []
-
-    # Get the absolute path of each image
-    print('Collecting training images... ', end='')
-    image_paths = pathname.get_training_images(label)
-    print('DONE')
-
-    # Add each of the persons images to the training set
-    print('Preparing images and labels... ', end='')
-    labels = [recognition.hash_label(label)] * len(image_paths)
-    for path in image_paths:
-        image_pil = Image.open(path)
-        image = numpy.array(image_pil)
-        (w, h) = image_pil.size
-        images.append(image[0: h, 0: w])
-    print('DONE')
-
     # Train
-    print('Training recognizer... ', end='')
-    recognizer.train(images, numpy.array(labels))
-    print('DONE')
-
-    # Save the newly trained recognizer
-    print('Saving recognizer: {}...'.format(filename), end='')
-    os.makedirs(pathname.get_recognizer_root(), exist_ok=True)
-    recognizer.save(recognizer_path)
-    print('DONE')
+    print('Training recognizer: {}.lbph.xml... '.format(label), end='')
+    sys.stdout.flush()
+    label, count, seconds = train(label, threads)
+    print('DONE ({} images, {:.2f}s)'.format(count, seconds))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+#######################################################################
+# Copyright (C) 2016-Present Tyler Cromwell <tjc6185@gmail.com>
+#
+# This file is part of Retina.
+#
+# Retina is free software: you can redistribute it and/or modify
+# it under Version 2 of the terms of the GNU General Public License
+# as published by the Free Software Foundation.
+#
+# Retina is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY of FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Retina.
+# If not, see <http://www.gnu.org/licenses/old-licenses/gpl-2.0.html>
+#######################################################################
+
+import concurrent.futures
+import getopt
+import itertools
+import os
+import socket
+import sys
+import time
+
+import cv2
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import configuration
+from modules import detection
+from modules import imgproc
+from modules import opt
+from modules import pathname
+from modules import runtime
+
+SCALE_FACTORS = [1.05, 1.1, 1.2, 1.3]
+MIN_NEIGHBORS = [3, 5, 8, 10]
+MIN_SIZES = [40, 60, 100]
+WIDTHS = [640, 1280]
+IOU_THRESHOLD = 0.5
+
+__images__ = []
+
+
+def print_usage(message=None):
+    """
+    Displays program usage information.
+    """
+    if message: print('>>>', message, end=' <<<\n')
+    print('Usage:\t./tune_settings.py --dataset=PATH [--settings=NAME] [--output=NAME] [--force] [--fps=FPS] [--jobs=JOBS]')
+    print('  -h --help\t\tPrints this text')
+    print('  -d --dataset=PATH\tDirectory of validation images containing a \'boxes.txt\' file')
+    print('                 \tEach line of \'boxes.txt\' is: FILENAME X Y W H')
+    print('  -s --settings=NAME\tThe settings file to start from (\'Recognizer\' is copied as-is)')
+    print('                 \tSee \'settings/\', without \'.txt\' extension')
+    print('  -o --output=NAME\tName of the settings file to write (Default: hostname)')
+    print('  -F --force\t\tOverwrite the output settings file if it exists')
+    print('  -f --fps=FPS\t\tTarget frames per second (Default: 10)')
+    print('  -j --jobs=JOBS\tNumber of parallel evaluation processes (Default: core count)')
+    print('  --scale-factors=LIST\tComma separated \'scaleFactor\' values to try')
+    print('  --neighbors=LIST\tComma separated \'minNeighbors\' values to try')
+    print('  --min-sizes=LIST\tComma separated square \'minSize\' values to try')
+    print('  --widths=LIST\t\tComma separated camera widths to try')
+    exit(0)
+
+
+def read_dataset(path):
+    """
+    Reads the ground truth boxes of a validation set.
+    Returns a list of (image path, [boxes]) pairs.
+    """
+    boxes = {}
+
+    with open(os.path.join(path, 'boxes.txt')) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 0 or fields[0].startswith('#'):
+                continue
+            name, box = fields[0], tuple(map(int, fields[1:5]))
+            boxes.setdefault(os.path.join(path, name), []).append(box)
+
+    return sorted(boxes.items())
+
+
+def load_dataset(dataset):
+    """
+    Process pool initializer, decodes the validation set once per worker.
+    """
+    for path, boxes in dataset:
+        image = cv2.imread(path)
+        if image is not None:
+            __images__.append((image, boxes))
+
+
+def evaluate(params, base):
+    """
+    Measures recall, precision, and mean per-frame latency of one parameter set.
+    """
+    config = make_config(params, base)
+    detector = detection.Detector(None, config)
+    width = params['width']
+    true_positives, detected, expected = 0, 0, 0
+    elapsed = 0.0
+
+    try:
+        for image, boxes in __images__:
+            scale = width / image.shape[1]
+            frame = cv2.resize(image, (width, int(image.shape[0] * scale)))
+            truth = [tuple(int(v * scale) for v in box) for box in boxes]
+
+            start = time.perf_counter()
+            objects = detector.detect(frame)
+            elapsed = elapsed + (time.perf_counter() - start)
+
+            matched = set()
+            for obj in objects:
+                for i, box in enumerate(truth):
+                    if i not in matched and imgproc.intersection_over_union(obj, box) >= IOU_THRESHOLD:
+                        matched.add(i)
+                        break
+
+            true_positives = true_positives + len(matched)
+            detected = detected + len(objects)
+            expected = expected + len(truth)
+    finally:
+        detector.close()
+
+    recall = true_positives / expected if expected else 0.0
+    precision = true_positives / detected if detected else 0.0
+    latency = elapsed / len(__images__) if __images__ else 0.0
+    return (params, recall, precision, latency)
+
+
+def make_config(params, base):
+    """
+    Builds a configuration from a parameter set and the base settings.
+    """
+    camera = dict(base['Camera'])
+    detector = dict(base['Detector'])
+    camera['width'] = str(params['width'])
+    camera['height'] = str(params['height'])
+    detector['classifier'] = params['classifier']
+    detector['scaleFactor'] = str(params['scaleFactor'])
+    detector['minNeighbors'] = str(params['minNeighbors'])
+    detector['minSize'] = '{0}, {0}'.format(params['minSize'])
+
+    # Regions and tile overlap are in pixels of a frame at the base width
+    scale = params['width'] / int(base['Camera']['width'])
+    if detector.get('regions', '').strip():
+        regions = detection.parse_regions(detector['regions'])
+        detector['regions'] = '; '.join(', '.join(str(int(v * scale)) for v in region) for region in regions)
+    if detector.get('overlap', '').strip():
+        detector['overlap'] = str(int(int(detector['overlap']) * scale))
+
+    return {'Camera': camera, 'Detector': detector, 'Recognizer': dict(base['Recognizer'])}
+
+
+def pareto_front(results):
+    """
+    Keeps the results not dominated in recall, precision, and latency.
+    """
+    front = []
+
+    for r in results:
+        dominated = False
+        for o in results:
+            better_or_equal = o[1] >= r[1] and o[2] >= r[2] and o[3] <= r[3]
+            strictly_better = o[1] > r[1] or o[2] > r[2] or o[3] < r[3]
+            if better_or_equal and strictly_better:
+                dominated = True
+                break
+        if not dominated:
+            front.append(r)
+
+    return front
+
+
+def f1(result):
+    recall, precision = result[1], result[2]
+    return (2 * recall * precision) / (recall + precision) if recall + precision > 0 else 0.0
+
+
+def retime(front, samples, base):
+    """
+    Measures the latency of each result again, one at a time in this process with
+    OpenCV's normal thread count, the way retina.py runs, instead of in a busy pool.
+    """
+    if len(__images__) == 0:
+        load_dataset(samples)
+
+    results = []
+    for i, (params, recall, precision, latency) in enumerate(front):
+        results.append((params, recall, precision, evaluate(params, base)[3]))
+        print('\rTiming the Pareto front... ({}/{})'.format(i+1, len(front)), end='')
+        sys.stdout.flush()
+    print('\rTiming the Pareto front... DONE        ')
+
+    return sorted(results, key=lambda r: r[3])
+
+
+def write_settings(path, config, sections):
+    """
+    Writes a configuration in the same layout as the files under 'settings/',
+    with every other section of the base settings copied as-is.
+    """
+    with open(path, 'w') as f:
+        for i, (section, options) in enumerate(sections.items()):
+            if i > 0: f.write('\n')
+            f.write('[{}]\n'.format(section))
+            for option, value in config.get(section, options).items():
+                f.write('{}: {}\n'.format(option, value))
+
+
+def main():
+    """
+    Main function.
+    """
+    dataset, output = None, socket.gethostname()
+    fps, jobs = 10.0, None
+    force = False
+    scale_factors, neighbors, min_sizes, widths = SCALE_FACTORS, MIN_NEIGHBORS, MIN_SIZES, WIDTHS
+    key = opt.default_settings()
+
+    try:
+        short_opts = 'hd:s:o:Ff:j:'
+        long_opts = ['help', 'dataset=', 'settings=', 'output=', 'force', 'fps=', 'jobs=',
+                     'scale-factors=', 'neighbors=', 'min-sizes=', 'widths=']
+        opts, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+    except getopt.GetoptError as error:
+        print_usage('Invalid argument: \"{}\"'.format(str(error)))
+
+    for o, a in opts:
+        if o == '-h' or o == '--help':          print_usage()
+        elif o == '-d' or o == '--dataset':     dataset = a if os.path.isfile(os.path.join(a, 'boxes.txt')) else None
+        elif o == '-s' or o == '--settings':    key = a
+        elif o == '-o' or o == '--output':      output = a
+        elif o == '-F' or o == '--force':       force = True
+        elif o == '-f' or o == '--fps':         fps = float(a)
+        elif o == '-j' or o == '--jobs':        jobs = max(1, int(a))
+        elif o == '--scale-factors':            scale_factors = list(map(float, a.split(',')))
+        elif o == '--neighbors':                neighbors = list(map(int, a.split(',')))
+        elif o == '--min-sizes':                min_sizes = list(map(int, a.split(',')))
+        elif o == '--widths':                   widths = list(map(int, a.split(',')))
+
+    if len(opts) == 0:
+        print_usage()
+    elif not opt.find_settings(key):
+        print_usage('Settings file \"{}\" not found'.format(key))
+
+    path = pathname.get_settings_root() + output + '.txt'
+
+    if not dataset:
+        print_usage('Validation set not specified')
+    elif os.path.exists(path) and not force:
+        print_usage('Settings file \"{}\" exists, pass --force to overwrite it'.format(output))
+
+    # Initialize variables
+    config = configuration.Config(opt.find_settings(key))
+    manager = runtime.Runtime(config)
+    jobs = jobs or manager.cores
+    sections = {s: dict(config[s]) for s in config.sections()}
+    base = {s: sections[s] for s in ['Camera', 'Detector', 'Recognizer']}
+    aspect = int(base['Camera']['height']) / int(base['Camera']['width'])
+    classifiers = sorted(f for f in os.listdir(pathname.get_classifier_root()) if f.endswith('.xml'))
+    samples = read_dataset(dataset)
+    grid = []
+
+    for c, s, n, m, w in itertools.product(classifiers, scale_factors, neighbors, min_sizes, widths):
+        grid.append({
+            'classifier': c, 'scaleFactor': s, 'minNeighbors': n,
+            'minSize': m, 'width': w, 'height': int(w * aspect)
+        })
+
+    print('Validation images: {}'.format(len(samples)))
+    print('Parameter sets: {}'.format(len(grid)))
+
+    # Evaluate each parameter set
+    results = []
+    with manager.process_pool(jobs, load_dataset, (samples,)) as executor:
+        futures = [executor.submit(evaluate, params, base) for params in grid]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            results.append(future.result())
+            print('\rEvaluating parameters... ({}/{})'.format(i+1, len(grid)), end='')
+            sys.stdout.flush()
+    print('\rEvaluating parameters... DONE        ')
+
+    # Latencies measured in the saturated pool only rank the candidates,
+    # the Pareto front is timed again the way retina.py runs
+    manager.apply()
+    front = retime(pareto_front(results), samples, base)
+
+    # Choose the most accurate point on the Pareto front that is fast enough
+    print('')
+    print('Pareto Front:')
+    print('  Recall  Precision  Latency  Parameters')
+    for params, recall, precision, latency in front:
+        print('  {:.3f}   {:.3f}      {:6.1f}ms {}'.format(recall, precision, latency * 1000, params))
+
+    candidates = [r for r in front if r[3] > 0 and 1 / r[3] >= fps]
+    if len(candidates) == 0:
+        print('\nNo parameters reach {:.1f} FPS, using the fastest'.format(fps))
+        candidates = front[:1]
+
+    best = max(candidates, key=f1)
+    write_settings(path, make_config(best[0], base), sections)
+    print('\nSaved settings: {} (recall {:.3f}, precision {:.3f}, {:.1f} FPS)'.format(
+        path, best[1], best[2], 1 / best[3] if best[3] > 0 else float('inf')))
+
+
+if __name__ == '__main__':
+    """
+    Program entry.
+    """
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        exit(0)